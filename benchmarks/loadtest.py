@@ -0,0 +1,516 @@
+"""
+Load test of the yatube views on a generated dataset.
+
+    python benchmarks/loadtest.py generate DIR [--users 1000] [--posts 100000] [--comments 200000] ...
+    python benchmarks/loadtest.py run DIR [--workers 4] [--seconds 30] [--mix read|mixed] [--output FILE]
+    python benchmarks/loadtest.py compare BASE.json NEW.json [--threshold 0.1]
+
+`generate` builds a dataset directory (database, media, cache) that is never the
+project's own: users, posts by Zipf-distributed authors, follows whose authors
+are Zipf-distributed too, comments, images with their thumbnails, follow
+inboxes, counters and the search index. The same arguments and seed give the
+same dataset.
+
+`run` replays a weighted mix of requests against yatube.wsgi.application
+in-process, one seeded request stream per worker process, so no web server or
+network is measured. The page cache is emptied before every run and warmed for
+--warmup seconds that are not counted. Results per URL name (requests/s,
+p50/p95/p99, errors) are written as JSON tagged with the git commit, by default
+to benchmarks/results/<commit>.json; `compare` prints the difference between
+two such files and exits with status 1 when a URL got slower than --threshold.
+"""
+import argparse
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from importlib import import_module
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+VOCABULARY = [f'слово{i}' for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+MIXES = {
+    'read': {
+        'index': 30, 'profile': 20, 'post': 20, 'group_posts': 10, 'follow_index': 12, 'search': 8,
+    },
+    'mixed': {
+        'index': 30, 'profile': 20, 'post': 20, 'group_posts': 10, 'follow_index': 12, 'search': 8,
+        'add_comment': 4, 'profile_follow': 2,
+    },
+}
+
+
+def setup(data, **overrides):
+    import django
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = os.path.join(data, 'db.sqlite3')
+    settings.CACHES['default']['LOCATION'] = os.path.join(data, 'cache', 'cache.sqlite3')
+    settings.MEDIA_ROOT = os.path.join(data, 'media')
+    # Production-like: no per-query debug log growing for the whole run.
+    settings.DEBUG = False
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+
+
+def zipf(count, exponent=1.0):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def write_image(path, rng):
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (1280, 720), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(30):
+        x, y = rng.randrange(1280), rng.randrange(720)
+        box = [x, y, x + rng.randrange(20, 400), y + rng.randrange(20, 300)]
+        draw.ellipse(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+    image.save(path, 'JPEG', quality=85)
+
+
+def generate(args):
+    if os.path.exists(args.data):
+        sys.exit(f'{args.data} already exists')
+    os.makedirs(os.path.join(args.data, 'media', 'posts'))
+    setup(args.data, POSTS_THUMBNAIL_WORKERS=0)
+    from django.core.management import call_command
+    from django.db import transaction
+
+    from posts import inbox, ranking, search, thumbnails
+    from posts.models import Comment, Follow, Group, Post, User, UserStats
+    from posts.transfer import set_dates
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    call_command('migrate', verbosity=0)
+    now = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with transaction.atomic():
+        # No batch_size: the backend picks one that fits SQLite's limits.
+        User.objects.bulk_create([
+            User(username=f'user{i}', password='!', date_joined=now - timedelta(days=args.days))
+            for i in range(args.users)
+        ])
+        users = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        Group.objects.bulk_create([
+            Group(title=f'Группа {i}', slug=f'group{i}', description=f'Описание группы {i}')
+            for i in range(args.groups)
+        ])
+        groups = list(Group.objects.order_by('pk').values_list('pk', flat=True))
+
+        # Popularity rank is independent of the user id.
+        authors = rng.sample(users, len(users))
+        author_weights = zipf(len(authors))
+        images = []
+        for i in range(args.images):
+            name = f'posts/bench{i}.jpg'
+            write_image(os.path.join(args.data, 'media', name), rng)
+            images.append(name)
+
+        span = timedelta(days=args.days).total_seconds() / max(args.posts, 1)
+        batch = []
+        for i in range(args.posts):
+            batch.append(Post(
+                pk=i + 1,
+                text=' '.join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(5, 60))),
+                pub_date=now - timedelta(days=args.days) + timedelta(seconds=i * span),
+                author_id=rng.choices(authors, cum_weights=author_weights)[0],
+                group_id=rng.choice(groups) if groups and rng.random() < 0.5 else None,
+                image=rng.choice(images) if images and rng.random() < args.image_ratio else '',
+            ))
+            if len(batch) == 10000 or i == args.posts - 1:
+                # bulk_create bypasses post_save, so the derived data is rebuilt below.
+                dates = {post.pk: post.pub_date for post in batch}
+                Post.objects.bulk_create(batch)
+                set_dates(Post, 'pub_date', dates)
+                batch = []
+        posts = list(Post.objects.order_by('pk').values_list('pk', 'pub_date'))
+
+        follows = set()
+        for user in users:
+            for author in rng.choices(authors, cum_weights=author_weights, k=rng.randint(1, 2 * args.follows)):
+                if author != user:
+                    follows.add((user, author))
+        Follow.objects.bulk_create([Follow(user_id=user, author_id=author) for user, author in sorted(follows)])
+
+        for i in range(args.comments):
+            post_id, pub_date = rng.choice(posts)
+            batch.append(Comment(
+                pk=i + 1,
+                post_id=post_id,
+                author_id=rng.choice(users),
+                text=' '.join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(3, 20))),
+                created=pub_date + timedelta(minutes=rng.randint(1, 60 * 24)),
+            ))
+            if len(batch) == 10000 or i == args.comments - 1:
+                dates = {comment.pk: comment.created for comment in batch}
+                Comment.objects.bulk_create(batch)
+                set_dates(Comment, 'created', dates)
+                batch = []
+
+        UserStats.objects.recount()
+        Post.objects.recount_comments()
+        inbox.backfill_authors({author for user, author in follows})
+        search.get_index().rebuild()
+        ranking.rebuild()
+    for name in images:
+        thumbnails.generate(name)
+
+    dataset = {
+        'seed': args.seed,
+        'users': args.users,
+        'groups': args.groups,
+        'posts': args.posts,
+        'comments': args.comments,
+        'follows': len(follows),
+        'images': args.images,
+    }
+    with open(os.path.join(args.data, 'dataset.json'), 'w') as file:
+        json.dump(dataset, file, indent=2)
+    print(f'{dataset} in {time.perf_counter() - started:.1f} s ({args.data})')
+
+
+def collect_targets(sessions, seed):
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+
+    from posts.models import Follow, Group, Post, User
+
+    # Popular authors first, so the Zipf weights land on them.
+    authors = list(User.objects.order_by('-stats__followers', 'pk').values_list('username', flat=True))
+    posts = list(Post.objects.order_by('-pub_date', '-id').values_list('author__username', 'pk')[:5000])
+    groups = list(Group.objects.order_by('pk').values_list('slug', flat=True))
+    rng = random.Random(seed)
+    users = list(User.objects.filter(stats__following__gt=0).order_by('pk'))
+    clients = []
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+    for user in rng.sample(users, min(sessions, len(users))):
+        store = SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        clients.append({
+            'username': user.username,
+            'cookie': f'{settings.SESSION_COOKIE_NAME}={store.session_key}',
+            'following': list(Follow.objects.filter(user=user).values_list('author__username', flat=True)),
+        })
+    return {'authors': authors, 'posts': posts, 'groups': groups, 'clients': clients}
+
+
+def make_environ(method, path, query='', cookie='', body=b''):
+    return {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': cookie,
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def call(application, environ):
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(value)
+        return lambda data: None
+
+    response = application(environ, start_response)
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return int(status[0].split()[0])
+
+
+class Traffic:
+    """A seeded stream of actions following the mix weights, each a list of (url name, WSGI environ)."""
+
+    def __init__(self, mix, targets, clients, rng):
+        from django.conf import settings
+        from django.utils.crypto import get_random_string
+        self.names = list(mix)
+        self.weights = list(itertools.accumulate(mix.values()))
+        self.authors, self.author_weights = targets['authors'], zipf(len(targets['authors']))
+        # Recent posts are read far more often than old ones.
+        self.posts, self.post_weights = targets['posts'], zipf(len(targets['posts']), 0.8)
+        self.groups = targets['groups']
+        self.clients = clients
+        self.rng = rng
+        self.csrf_token = get_random_string(64)
+        self.csrf_cookie = f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        name = self.rng.choices(self.names, cum_weights=self.weights)[0]
+        return getattr(self, name)()
+
+    def page(self):
+        # Mostly the first page, sometimes a few pages deep.
+        page = 1 if self.rng.random() < 0.8 else self.rng.randint(2, 10)
+        return urlencode({'page': page}) if page > 1 else ''
+
+    def author(self):
+        return self.rng.choices(self.authors, cum_weights=self.author_weights)[0]
+
+    def request(self, name, *args, method='GET', query='', client=None, data=None):
+        from django.urls import reverse
+        cookie = client['cookie'] if client else ''
+        body = b''
+        if data is not None:
+            cookie = f'{cookie}; {self.csrf_cookie}'
+            body = urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token}).encode()
+        return [(name, make_environ(method, reverse(name, args=args), query, cookie, body))]
+
+    def index(self):
+        return self.request('index', query=self.page())
+
+    def profile(self):
+        return self.request('profile', self.author(), query=self.page())
+
+    def post(self):
+        return self.request('post', *self.rng.choices(self.posts, cum_weights=self.post_weights)[0])
+
+    def group_posts(self):
+        return self.request('group_posts', self.rng.choice(self.groups), query=self.page())
+
+    def follow_index(self):
+        return self.request('follow_index', query=self.page(), client=self.rng.choice(self.clients))
+
+    def search(self):
+        query = ' '.join(self.rng.sample(VOCABULARY[10:2000], self.rng.choice([1, 1, 2])))
+        return self.request('search', query=urlencode({'q': query}))
+
+    def add_comment(self):
+        username, post_id = self.rng.choices(self.posts, cum_weights=self.post_weights)[0]
+        text = ' '.join(self.rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=8))
+        return self.request(
+            'add_comment', username, post_id, method='POST', client=self.rng.choice(self.clients), data={'text': text}
+        )
+
+    def profile_follow(self):
+        # Follow and unfollow in pairs, so the dataset keeps its shape.
+        client = self.rng.choice(self.clients)
+        author = self.author()
+        if author == client['username'] or author in client['following']:
+            return self.index()
+        return [
+            *self.request('profile_follow', author, client=client),
+            *self.request('profile_unfollow', author, client=client),
+        ]
+
+
+def worker(index, args, targets, start, results):
+    setup(args.data, PERF_INSTRUMENTATION=args.instrumented, ANONYMOUS_PAGE_CACHE=not args.no_page_cache)
+    from yatube.wsgi import application
+
+    clients = targets['clients'][index::args.workers] or targets['clients']
+    traffic = Traffic(MIXES[args.mix], targets, clients, random.Random(args.seed * 1000 + index))
+    samples, errors = defaultdict(list), Counter()
+    start.wait()
+    counted = time.monotonic() + args.warmup
+    deadline = counted + args.seconds
+    while time.monotonic() < deadline:
+        for name, environ in next(traffic):
+            started = time.perf_counter()
+            status = call(application, environ)
+            duration = time.perf_counter() - started
+            if started >= counted:
+                samples[name].append(duration)
+                if status >= 400:
+                    errors[name] += 1
+    results.put((dict(samples), dict(errors)))
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def report(samples, errors, seconds):
+    from yatube.instrumentation import percentile
+    durations = sorted(value * 1000 for value in samples)
+    return {
+        'requests': len(durations),
+        'errors': errors,
+        'rps': round(len(durations) / seconds, 1),
+        **{f'p{q}_ms': round(percentile(durations, q / 100), 2) for q in (50, 95, 99)},
+    }
+
+
+def run(args):
+    shutil.rmtree(os.path.join(args.data, 'cache'), ignore_errors=True)
+    setup(args.data)
+    import django
+    targets = collect_targets(args.sessions, args.seed)
+
+    context = multiprocessing.get_context('spawn')
+    start, results = context.Event(), context.Queue()
+    processes = [
+        context.Process(target=worker, args=(index, args, targets, start, results)) for index in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(2)
+    start.set()
+    samples, errors = defaultdict(list), Counter()
+    for _ in processes:
+        while True:
+            try:
+                worker_samples, worker_errors = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if any(process.exitcode for process in processes):
+                    sys.exit('A worker failed, see its traceback above')
+        for name, values in worker_samples.items():
+            samples[name].extend(values)
+        errors.update(worker_errors)
+    for process in processes:
+        process.join()
+
+    commit = git('rev-parse', 'HEAD')
+    with open(os.path.join(args.data, 'dataset.json')) as file:
+        dataset = json.load(file)
+    result = {
+        'meta': {
+            'commit': commit,
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+            'subject': git('log', '-1', '--format=%s'),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'mix': args.mix,
+            'workers': args.workers,
+            'seconds': args.seconds,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'instrumented': args.instrumented,
+            'page_cache': not args.no_page_cache,
+            'dataset': dataset,
+        },
+        'total': report(list(itertools.chain(*samples.values())), sum(errors.values()), args.seconds),
+        'urls': {name: report(values, errors[name], args.seconds) for name, values in sorted(samples.items())},
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'{commit[:10] or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(result, file, indent=2, ensure_ascii=False)
+
+    print(f'{args.mix} mix, {args.workers} workers, {args.seconds:g} s, commit {commit[:10]}')
+    print(f'{"url":<16}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, row in [*result['urls'].items(), ('total', result['total'])]:
+        print(
+            f'{name:<16}{row["rps"]:>10.1f}{row["p50_ms"]:>10.2f}{row["p95_ms"]:>10.2f}'
+            f'{row["p99_ms"]:>10.2f}{row["errors"]:>8}'
+        )
+    print(f'-> {output}')
+
+
+def change(old, new):
+    return (new - old) / old if old else 0.0
+
+
+def compare(args):
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    print(f'{base["meta"]["commit"][:10]} -> {new["meta"]["commit"][:10]}')
+    if base['meta']['dataset'] != new['meta']['dataset'] or base['meta']['mix'] != new['meta']['mix']:
+        print('warning: the runs used different datasets or mixes')
+    print(f'{"url":<16}{"req/s":>25}{"p95 ms":>26}')
+    rows = {name: (base['urls'].get(name), new['urls'].get(name)) for name in sorted({*base['urls'], *new['urls']})}
+    rows['total'] = base['total'], new['total']
+    regressions = []
+    for name, (old, current) in rows.items():
+        if old is None or current is None:
+            print(f'{name:<16}{"only in one run":>25}')
+            continue
+        rps, p95 = change(old['rps'], current['rps']), change(old['p95_ms'], current['p95_ms'])
+        slower = rps < -args.threshold or p95 > args.threshold
+        if slower:
+            regressions.append(name)
+        print(
+            f'{name:<16}{old["rps"]:>9.1f} ->{current["rps"]:>7.1f} {rps:>+5.0%}'
+            f'{old["p95_ms"]:>9.2f} ->{current["p95_ms"]:>8.2f} {p95:>+5.0%}{"  slower" if slower else ""}'
+        )
+    if regressions:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('generate')
+    command.add_argument('data')
+    command.add_argument('--users', type=int, default=1000)
+    command.add_argument('--groups', type=int, default=20)
+    command.add_argument('--posts', type=int, default=100000)
+    command.add_argument('--comments', type=int, default=200000)
+    command.add_argument('--follows', type=int, default=20, help='Average follows per user')
+    command.add_argument('--images', type=int, default=20, help='Distinct image files shared by the posts')
+    command.add_argument('--image-ratio', type=float, default=0.2)
+    command.add_argument('--days', type=int, default=365)
+    command.add_argument('--seed', type=int, default=1)
+    command.set_defaults(handler=generate)
+
+    command = commands.add_parser('run')
+    command.add_argument('data')
+    command.add_argument('--mix', choices=sorted(MIXES), default='read')
+    command.add_argument('--workers', type=int, default=4)
+    command.add_argument('--seconds', type=float, default=30)
+    command.add_argument('--warmup', type=float, default=5)
+    command.add_argument('--sessions', type=int, default=100, help='Logged-in users shared by the workers')
+    command.add_argument('--instrumented', action='store_true', help='Keep InstrumentationMiddleware on')
+    command.add_argument('--no-page-cache', action='store_true', help='Turn the WSGI anonymous page cache off')
+    command.add_argument('--seed', type=int, default=1)
+    command.add_argument('--output')
+    command.set_defaults(handler=run)
+
+    command = commands.add_parser('compare')
+    command.add_argument('base')
+    command.add_argument('new')
+    command.add_argument('--threshold', type=float, default=0.1)
+    command.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Media serving under concurrency: django.views.static.serve against yatube.media.serve.
+
+    python benchmarks/media.py [--size-mb 8] [--files 4] [--clients 8] [--requests 400]
+
+Large image files go into a temporary MEDIA_ROOT. Each case sends --requests
+requests from --clients threads to the view and reads the whole body, as the
+WSGI server would without sendfile. The cases are a full download, a 256 KB
+range at a random offset (a resumed or seeking client) and a revalidation by
+ETag. Reports requests/s, latency percentiles and the bytes sent.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+RANGE_SIZE = 256 * 1024
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return f'p50 {pick(0.5):8.2f} ms  p99 {pick(0.99):8.2f} ms'
+
+
+def run(view, make_request, clients, requests):
+    def one(index):
+        request = make_request(index)
+        started = time.perf_counter()
+        response = view(request)
+        sent = sum(map(len, response))
+        response.close()
+        return time.perf_counter() - started, sent
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        results = list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    sent = sum(size for _, size in results)
+    return (
+        f'{requests / elapsed:8.1f} req/s  {percentiles([duration for duration, _ in results])}'
+        f'  {sent / 2 ** 20:9.1f} MB sent'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    directory = tempfile.TemporaryDirectory()
+    settings.MEDIA_ROOT = directory.name
+    django.setup()
+    from django.test import RequestFactory
+    from django.views import static
+
+    from yatube import media
+
+    size = int(args.size_mb * 2 ** 20)
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'posts'))
+    names = [f'posts/image{i}.jpg' for i in range(args.files)]
+    for name in names:
+        with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as file:
+            file.write(os.urandom(size))
+
+    factory = RequestFactory()
+    rng = random.Random(args.seed)
+    views = {
+        'static.serve': lambda request: static.serve(request, request.name, document_root=settings.MEDIA_ROOT),
+        'media.serve': lambda request: media.serve(request, request.name),
+    }
+    etags = {}
+    for name in names:
+        response = media.serve(factory.get('/'), name)
+        etags[name] = response['ETag']
+        response.close()
+
+    def request(name, **headers):
+        request = factory.get(f'/media/{name}', **headers)
+        request.name = name
+        return request
+
+    def ranged(name):
+        first = rng.randrange(size - RANGE_SIZE)
+        return request(name, HTTP_RANGE=f'bytes={first}-{first + RANGE_SIZE - 1}')
+
+    cases = {
+        'full': lambda index: request(names[index % len(names)]),
+        'range 256 KB': lambda index: ranged(names[index % len(names)]),
+        'etag revalidation': lambda index: request(
+            names[index % len(names)], HTTP_IF_NONE_MATCH=etags[names[index % len(names)]]
+        ),
+    }
+    print(f'{args.files} files of {args.size_mb:g} MB, {args.clients} clients, {args.requests} requests per case')
+    for case, make_request in cases.items():
+        for name, view in views.items():
+            print(f'{case:18} {name:13} {run(view, make_request, args.clients, args.requests)}')
+    settings.MEDIA_ACCEL_REDIRECT = '/protected-media/'
+    print(f'{"full":18} {"X-Accel":13} {run(views["media.serve"], cases["full"], args.clients, args.requests)}')
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
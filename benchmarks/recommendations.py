@@ -0,0 +1,104 @@
+"""
+"Who to follow" on a generated follow graph (1M edges by default).
+
+    python benchmarks/recommendations.py [--users N] [--edges N] [--db PATH]
+
+The graph goes into a separate SQLite file, never into the project database.
+Followed authors are Zipf-distributed, so a few authors have most followers.
+Reports the time to load the graph, score every user and write the results,
+and the latency of the incremental refresh that follows a single follow.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return f'p50 {pick(0.5):8.2f} ms  p95 {pick(0.95):8.2f} ms  p99 {pick(0.99):8.2f} ms'
+
+
+def fill(connection, users, edges, seed):
+    rng = random.Random(seed)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+            " is_active, date_joined) VALUES ('', 0, %s, '', '', '', 0, 1, '2020-01-01')",
+            [(f'user{i}',) for i in range(users)],
+        )
+        cursor.execute('SELECT id FROM auth_user ORDER BY id')
+        ids = [pk for pk, in cursor.fetchall()]
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(users)))
+        pairs = set()
+        while len(pairs) < edges:
+            user_id = rng.choice(ids)
+            author_id = rng.choices(ids, cum_weights=cum_weights)[0]
+            if user_id != author_id:
+                pairs.add((user_id, author_id))
+        pairs = list(pairs)
+        rng.shuffle(pairs)
+        cursor.executemany('INSERT INTO posts_follow (user_id, author_id) VALUES (%s, %s)', pairs)
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--refreshes', type=int, default=200)
+    parser.add_argument('--db', help='Reuse this graph file instead of building a new one')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'follows.sqlite3')
+    fresh = not os.path.exists(path)
+    settings.DATABASES['default']['NAME'] = path
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+
+    from posts import recommendations
+    from posts.models import Follow
+
+    if fresh:
+        call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        with transaction.atomic():
+            fill(connection, args.users, args.edges, args.seed)
+        print(f'graph: {args.users} users, {args.edges} edges in {time.perf_counter() - started:.1f} s ({path})')
+
+    started = time.perf_counter()
+    graph = recommendations.FollowGraph.load()
+    loaded = time.perf_counter()
+    recommender = recommendations.Recommender(graph)
+    results = {user_id: recommender.recommend(user_id) for user_id in graph.following}
+    scored = time.perf_counter()
+    print(f'load   {loaded - started:6.1f} s  ({sum(map(len, graph.following.values()))} edges)')
+    print(f'score  {scored - loaded:6.1f} s  ({len(results)} users)')
+
+    started = time.perf_counter()
+    saved = recommendations.rebuild()
+    print(f'rebuild (load + score + write) {time.perf_counter() - started:6.1f} s  ({saved} rows)')
+
+    rng = random.Random(args.seed)
+    user_ids = rng.sample(list(Follow.objects.values_list('user_id', flat=True).distinct()), args.refreshes)
+    samples = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        recommendations.refresh([user_id])
+        samples.append(time.perf_counter() - started)
+    print(f'refresh one user  {percentiles(samples)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Search latency on a generated corpus (1M posts by default).
+
+    python benchmarks/search_latency.py [--posts N] [--backend fts5|postings] [--db PATH]
+
+The corpus goes into a separate SQLite file, never into the project database.
+Reports p50/p95/p99 of the first page, of a page deep in the results, and of
+the LIKE scan the admin search does.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+VOCABULARY = [f'слово{i}' for i in range(20000)]
+# Zipf-like: a handful of very common words and a long tail, as in real text.
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return f'p50 {pick(0.5):8.2f} ms  p95 {pick(0.95):8.2f} ms  p99 {pick(0.99):8.2f} ms'
+
+
+def fill(connection, posts, seed):
+    rng = random.Random(seed)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+            " is_active, date_joined) VALUES ('', 0, 'bench', '', '', '', 0, 1, '2020-01-01')"
+        )
+        author_id = cursor.lastrowid
+        batch = []
+        for i in range(posts):
+            text = ' '.join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(5, 40)))
+            batch.append((text, f'2020-01-01 00:00:{i % 60:02d}', author_id, '', 0, 0))
+            if len(batch) == 10000 or i == posts - 1:
+                cursor.executemany(
+                    'INSERT INTO posts_post (text, pub_date, author_id, image, version, comment_count)'
+                    ' VALUES (%s, %s, %s, %s, %s, %s)',
+                    batch,
+                )
+                batch = []
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--backend', choices=['fts5', 'postings'], default='fts5')
+    parser.add_argument('--db', help='Reuse this corpus file instead of building a new one')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'search.sqlite3')
+    fresh = not os.path.exists(path)
+    settings.DATABASES['default']['NAME'] = path
+    settings.POSTS_SEARCH_BACKEND = 'postings' if args.backend == 'postings' else 'auto'
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+
+    from posts import search
+    from posts.models import Post
+
+    if fresh:
+        call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        with transaction.atomic():
+            fill(connection, args.posts, args.seed)
+        print(f'corpus: {args.posts} posts in {time.perf_counter() - started:.1f} s ({path})')
+    index = search.get_index()
+    started = time.perf_counter()
+    with transaction.atomic():
+        index.rebuild()
+    print(f'{type(index).__name__} rebuild: {time.perf_counter() - started:.1f} s')
+
+    rng = random.Random(args.seed)
+    queries = [
+        ' '.join(rng.sample(VOCABULARY[10:2000], rng.choice([1, 1, 2]))) for _ in range(args.queries)
+    ]
+    first, deep, like = [], [], []
+    for query in queries:
+        paginator = search.SearchPaginator(query, 10)
+        started = time.perf_counter()
+        page = paginator.get_page(None)
+        first.append(time.perf_counter() - started)
+        for _ in range(4):
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+            started = time.perf_counter()
+            page = paginator.get_page(cursor)
+        deep.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        list(Post.objects.filter(text__icontains=query.split()[0]).order_by('-pub_date')[:10])
+        like.append(time.perf_counter() - started)
+    print(f'first page  {percentiles(first)}')
+    print(f'fifth page  {percentiles(deep)}')
+    print(f'LIKE scan   {percentiles(like)}')
+
+
+if __name__ == '__main__':
+    main()
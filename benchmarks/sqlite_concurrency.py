@@ -0,0 +1,131 @@
+"""
+Concurrent feed reads and post writes against SQLite: bare backend vs yatube.db.
+
+    python benchmarks/sqlite_concurrency.py [--readers 8] [--writers 2] [--seconds 10]
+
+Every worker is a separate process with its own connection, as under a
+multi-process WSGI server. A write is a read-then-write transaction, like
+new_post: it reads the author's counter and then inserts the post.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+BACKENDS = {
+    'sqlite3': {'ENGINE': 'django.db.backends.sqlite3'},
+    'yatube.db': {'ENGINE': 'yatube.db', 'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'maintenance_interval': 0}},
+}
+
+
+def setup(database):
+    import django
+    from django.conf import settings
+    settings.DATABASES['default'] = database
+    django.setup()
+
+
+def prepare(path, posts):
+    setup({'ENGINE': 'django.db.backends.sqlite3', 'NAME': path})
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    call_command('migrate', verbosity=0)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+            " is_active, date_joined) VALUES ('', 0, 'bench', '', '', '', 0, 1, '2020-01-01')"
+        )
+        cursor.execute(
+            'INSERT INTO posts_userstats (user_id, followers, following, posts, comments) VALUES (1, 0, 0, 0, 0)'
+        )
+        cursor.executemany(
+            "INSERT INTO posts_post (text, pub_date, author_id, image, version, comment_count)"
+            " VALUES (%s, %s, 1, '', 0, 0)",
+            [(f'Запись {i}', f'2020-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}') for i in range(posts)],
+        )
+
+
+def worker(role, database, seconds, start, results):
+    setup(database)
+    from django.db import OperationalError, connection, transaction
+    from posts.models import Post
+
+    ops = errors = 0
+    start.wait()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if role == 'reader':
+                list(Post.objects.feed()[:10])
+            else:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute('SELECT posts FROM posts_userstats WHERE user_id = 1')
+                    cursor.fetchone()
+                    cursor.execute(
+                        "INSERT INTO posts_post (text, pub_date, author_id, image, version, comment_count)"
+                        " VALUES ('Новая запись', datetime('now'), 1, '', 0, 0)"
+                    )
+                    cursor.execute('UPDATE posts_userstats SET posts = posts + 1 WHERE user_id = 1')
+            ops += 1
+        except OperationalError:
+            errors += 1
+    results.put((role, ops, errors))
+
+
+def run(name, path, args):
+    context = multiprocessing.get_context('spawn')
+    database = {**BACKENDS[name], 'NAME': path}
+    start, results = context.Event(), context.Queue()
+    roles = ['reader'] * args.readers + ['writer'] * args.writers
+    processes = [context.Process(target=worker, args=(role, database, args.seconds, start, results)) for role in roles]
+    for process in processes:
+        process.start()
+    time.sleep(2)
+    start.set()
+    totals = {'reader': [0, 0], 'writer': [0, 0]}
+    for _ in processes:
+        role, ops, errors = results.get()
+        totals[role][0] += ops
+        totals[role][1] += errors
+    for process in processes:
+        process.join()
+    (reads, read_errors), (writes, write_errors) = totals['reader'], totals['writer']
+    print(
+        f'{name:<10}{reads / args.seconds:>12.0f}{writes / args.seconds:>12.0f}'
+        f'{read_errors:>14}{write_errors:>14}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=10000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    template = os.path.join(directory, 'template.sqlite3')
+    context = multiprocessing.get_context('spawn')
+    process = context.Process(target=prepare, args=(template, args.posts))
+    process.start()
+    process.join()
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g} s')
+    print(f'{"backend":<10}{"reads/s":>12}{"writes/s":>12}{"read errors":>14}{"write errors":>14}')
+    try:
+        for name in BACKENDS:
+            path = os.path.join(directory, f'{name}.sqlite3')
+            shutil.copy(template, path)
+            run(name, path, args)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Popular posts: the PostScore ranking against the naive aggregate query.
+
+    python benchmarks/trending.py [--posts N] [--comments N] [--db PATH]
+
+The data goes into a separate SQLite file, never into the project database.
+Posts and comments are spread over the last week; comments favour a Zipf
+head of posts. Reports the top-N latency of both, site-wide and per group,
+the cost of a recorded event and of a full rebuild.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000  # noqa: E731
+    return f'p50 {pick(0.5):8.2f} ms  p95 {pick(0.95):8.2f} ms  p99 {pick(0.99):8.2f} ms'
+
+
+def measure(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def fill(connection, posts, comments, groups, seed):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    week = 7 * 24 * 60 * 60
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email, is_staff,"
+            " is_active, date_joined) VALUES ('', 0, 'bench', '', '', '', 0, 1, '2020-01-01')"
+        )
+        author_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT INTO posts_group (title, slug, description) VALUES (%s, %s, %s)',
+            [(f'Группа {i}', f'group{i}', '') for i in range(groups)],
+        )
+        dates = sorted(now - timedelta(seconds=rng.randrange(week)) for _ in range(posts))
+        for start in range(0, posts, 10000):
+            cursor.executemany(
+                'INSERT INTO posts_post (text, pub_date, author_id, group_id, image, version, comment_count)'
+                ' VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                [
+                    ('Запись', date.isoformat(sep=' '), author_id, rng.randint(1, groups), '', 0, 0)
+                    for date in dates[start:start + 10000]
+                ],
+            )
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(posts)))
+        post_ids = list(range(1, posts + 1))
+        rng.shuffle(post_ids)
+        for start in range(0, comments, 10000):
+            batch = []
+            for post_id in rng.choices(post_ids, cum_weights=cum_weights, k=min(10000, comments - start)):
+                created = max(dates[post_id - 1], now - timedelta(seconds=rng.randrange(week)))
+                batch.append((post_id, author_id, 'Комментарий', created.isoformat(sep=' ')))
+            cursor.executemany(
+                'INSERT INTO posts_comment (post_id, author_id, text, created) VALUES (%s, %s, %s, %s)', batch
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=200000)
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', help='Reuse this data file instead of building a new one')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'trending.sqlite3')
+    fresh = not os.path.exists(path)
+    settings.DATABASES['default']['NAME'] = path
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from django.db.models import Count, Q
+    from django.utils import timezone as django_timezone
+
+    from posts import ranking
+    from posts.models import Post
+
+    if fresh:
+        call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        with transaction.atomic():
+            fill(connection, args.posts, args.comments, args.groups, args.seed)
+        print(f'data: {args.posts} posts, {args.comments} comments in {time.perf_counter() - started:.1f} s ({path})')
+
+    started = time.perf_counter()
+    rows = ranking.rebuild()
+    print(f'rebuild  {time.perf_counter() - started:6.1f} s  ({rows} rows kept)')
+
+    size = settings.POSTS_TRENDING_SIZE
+
+    def naive(group_id=None):
+        since = django_timezone.now() - timedelta(days=1)
+        posts = Post.objects.feed().annotate(engagement=Count('comments', filter=Q(comments__created__gte=since)))
+        if group_id is not None:
+            posts = posts.filter(group_id=group_id)
+        return list(posts.order_by('-engagement', '-pub_date')[:size])
+
+    print(f'naive site   {measure(naive, max(1, args.repeat // 5))}')
+    print(f'naive group  {measure(lambda: naive(1), args.repeat)}')
+    print(f'ranked site  {measure(ranking.top, args.repeat * 10)}')
+    print(f'ranked group {measure(lambda: ranking.top(1), args.repeat * 10)}')
+
+    rng = random.Random(args.seed)
+    print(f'record comment {measure(lambda: ranking.record("comment", rng.randint(1, args.posts)), args.repeat * 10)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Peak memory of one image upload: Django's default upload handling vs posts.uploads.
+
+    python benchmarks/upload_memory.py
+
+Every case runs in a fresh process; the report shows the tracemalloc peak
+(Python allocations) and the growth of max RSS (includes Pillow's buffers)
+once the request body is in memory.
+"""
+import io
+import multiprocessing
+import os
+import resource
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+CASES = [
+    ('jpeg 800x600', (800, 600), 'JPEG', 'RGB'),
+    ('jpeg 6000x4000', (6000, 4000), 'JPEG', 'RGB'),
+    ('png 20000x20000 1-bit', (20000, 20000), 'PNG', '1'),
+]
+DEFAULT_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+
+def make_image(size, image_format, mode):
+    from PIL import Image
+
+    image_file = io.BytesIO()
+    Image.new(mode, size).save(image_file, image_format)
+    return image_file.getvalue()
+
+
+def measure(pipeline, data, image_format, results):
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.forms import modelform_factory
+    from django.test import RequestFactory
+    from django.test.utils import override_settings
+    from PIL import Image
+
+    from posts.forms import PostForm
+    from posts.models import Post
+
+    image_file = io.BytesIO(data)
+    image_file.name = f'upload.{image_format.lower()}'
+    request = RequestFactory().post('/new/', {'text': 'benchmark', 'image': image_file})
+    del image_file, data
+    handlers = DEFAULT_HANDLERS if pipeline == 'default' else settings.FILE_UPLOAD_HANDLERS
+    # The default pipeline would refuse the bomb only at Pillow's own limit; lift it to show the cost.
+    Image.MAX_IMAGE_PIXELS = None if pipeline == 'default' else Image.MAX_IMAGE_PIXELS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    with override_settings(FILE_UPLOAD_HANDLERS=handlers):
+        request.upload_handlers = None
+        if pipeline == 'default':
+            form = modelform_factory(Post, fields=['text', 'image'])(request.POST, request.FILES)
+        else:
+            form = PostForm(request.POST, request.FILES, upload_errors=getattr(request, 'upload_errors', None))
+        valid = form.is_valid()
+        if valid and pipeline == 'default':
+            # What storing and then thumbnailing an unbounded original costs.
+            Image.open(form.cleaned_data['image']).load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.put((valid, peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss))
+
+
+def main():
+    context = multiprocessing.get_context('spawn')
+    print(f'{"image":<24}{"pipeline":<10}{"valid":<7}{"traced peak, KiB":>18}{"RSS growth, KiB":>18}')
+    for name, size, image_format, mode in CASES:
+        data = make_image(size, image_format, mode)
+        for pipeline in ('default', 'bounded'):
+            results = context.Queue()
+            process = context.Process(target=measure, args=(pipeline, data, image_format, results))
+            process.start()
+            valid, peak, rss = results.get()
+            process.join()
+            print(f'{name:<24}{pipeline:<10}{str(valid):<7}{peak // 1024:>18}{rss:>18}')
+
+
+if __name__ == '__main__':
+    main()
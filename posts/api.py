@@ -0,0 +1,137 @@
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from yatube.db.routers import reads_from_replica
+
+from .caching import get_last_modified, get_versions
+from .models import Comment, Group, Post, User
+from .paginator import PER_PAGE, CursorPaginator
+
+POST_FIELDS = ('pk', 'text', 'pub_date', 'image', 'author__username', 'group__slug', 'comment_count')
+
+
+def feed_condition(scope, kwarg=None):
+    """
+    Conditional GET for a feed, validated by the page cache scope versions:
+    a 304 costs a cache lookup and no query, serialization or rendering.
+    """
+    def scopes(kwargs):
+        return [f'{scope}:{kwargs[kwarg]}' if kwarg else scope]
+
+    # A replica may not have the write that bumped the version yet, and its
+    # older data must not be validated by the new ETag.
+    def etag(request, **kwargs):
+        if not reads_from_replica():
+            return '-'.join(str(version) for version in get_versions(scopes(kwargs)))
+
+    def last_modified(request, **kwargs):
+        modified = None if reads_from_replica() else get_last_modified(scopes(kwargs))
+        return modified and datetime.fromtimestamp(modified, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def post_etag(request, username, post_id):
+    # Post.version is bumped by edits and by comments.
+    if not reads_from_replica():
+        versions = Post.objects.filter(pk=post_id, author__username=username).order_by().values_list('version')
+        version = next((version for version, in versions[:1]), None)
+        return None if version is None else f'{post_id}.{version}'
+
+
+def json_response(payload):
+    return HttpResponse(
+        json.dumps(payload, ensure_ascii=False, separators=(',', ':')), content_type='application/json'
+    )
+
+
+def serialize_post(row):
+    return {
+        'id': row['pk'],
+        'text': row['text'],
+        'pub_date': row['pub_date'].isoformat(),
+        'author': row['author__username'],
+        'group': row['group__slug'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'comments': row['comment_count'],
+    }
+
+
+def page_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def feed_payload(request, posts):
+    # Plain dict rows instead of model instances: nothing to build but the JSON.
+    page = CursorPaginator(posts.values(*POST_FIELDS), PER_PAGE).get_page(request.GET.get('cursor'))
+    return {
+        'results': [serialize_post(row) for row in page],
+        'next': page_url(request, page.next_cursor),
+        'previous': page_url(request, page.previous_cursor),
+    }
+
+
+@require_safe
+@feed_condition('index')
+def index(request):
+    return json_response(feed_payload(request, Post.objects.feed()))
+
+
+@require_safe
+@feed_condition('group', 'slug')
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.values('pk', 'slug', 'title', 'description'), slug=slug)
+    posts = Post.objects.feed().filter(group_id=group.pop('pk'))
+    return json_response({**group, **feed_payload(request, posts)})
+
+
+@require_safe
+@feed_condition('profile', 'username')
+def profile(request, username):
+    author = get_object_or_404(
+        User.objects.values(
+            'pk', 'username', 'first_name', 'last_name',
+            'stats__followers', 'stats__following', 'stats__posts', 'stats__comments',
+        ),
+        username=username,
+    )
+    return json_response({
+        'username': author['username'],
+        'full_name': f'{author["first_name"]} {author["last_name"]}'.strip(),
+        **{name: author[f'stats__{name}'] or 0 for name in ('followers', 'following', 'posts', 'comments')},
+        **feed_payload(request, Post.objects.feed().filter(author_id=author['pk'])),
+    })
+
+
+@require_safe
+@condition(etag_func=post_etag)
+def post_view(request, username, post_id):
+    post = get_object_or_404(Post.objects.feed().values(*POST_FIELDS), pk=post_id, author__username=username)
+    comments = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).values('pk', 'author__username', 'text', 'created'),
+        settings.POSTS_COMMENTS_PER_PAGE,
+        ordering=('created', 'pk'),
+    ).get_page(request.GET.get('cursor'))
+    return json_response({
+        **serialize_post(post),
+        'comment_list': [
+            {
+                'id': row['pk'],
+                'author': row['author__username'],
+                'text': row['text'],
+                'created': row['created'].isoformat(),
+            }
+            for row in comments
+        ],
+        'next': page_url(request, comments.next_cursor),
+    })
@@ -0,0 +1,111 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube.db.routers import reads_from_replica
+
+from .models import Group, User
+
+
+def version_key(scope):
+    return f'version:{scope}'
+
+
+def modified_key(scope):
+    return f'modified:{scope}'
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for scope, key in zip(scopes, keys):
+        if key not in versions:
+            # Start from the clock, not from 1, so an evicted counter never
+            # comes back at a value that old cache entries were stored under.
+            cache.add(key, int(time.time() * 1000), None)
+            cache.add(modified_key(scope), time.time(), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def get_last_modified(scopes):
+    # When any of the scopes was last bumped, None if the cache lost track.
+    times = cache.get_many([modified_key(scope) for scope in scopes])
+    return max(times.values()) if len(times) == len(scopes) else None
+
+
+def _incr_versions(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            get_versions([scope])
+    if scopes:
+        cache.set_many({modified_key(scope): time.time() for scope in scopes}, None)
+
+
+def bump_versions(*scopes):
+    # Bump now for this process and again on commit, so a page rebuilt
+    # from not yet committed data cannot stay cached under the new version.
+    scopes = [scope for scope in scopes if scope]
+    _incr_versions(scopes)
+    transaction.on_commit(lambda: _incr_versions(scopes))
+
+
+def page_scopes(user_ids=(), group_ids=()):
+    user_ids = {pk for pk in user_ids if pk}
+    group_ids = {pk for pk in group_ids if pk}
+    usernames = User.objects.filter(pk__in=user_ids).values_list('username', flat=True) if user_ids else []
+    slugs = Group.objects.filter(pk__in=group_ids).values_list('slug', flat=True) if group_ids else []
+    return [*(f'profile:{username}' for username in usernames), *(f'group:{slug}' for slug in slugs)]
+
+
+def versioned_cache_page(scope, kwarg=None):
+    """
+    Cache a view until one of its scope versions is bumped.
+
+    A stale entry is rebuilt by the single request that takes the lock;
+    concurrent requests keep getting the previous response meanwhile.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scopes = [f'{scope}:{kwargs[kwarg]}' if kwarg else scope]
+            versions = get_versions(scopes)
+            viewer = request.user.pk if request.user.is_authenticated else ''
+            path = hashlib.md5(f'{viewer}:{request.get_full_path()}'.encode()).hexdigest()
+            key = f'page:{scopes[0]}:{path}'
+            lock_key = f'{key}:lock'
+
+            cached = cache.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+            if not cache.add(lock_key, 1, settings.POSTS_PAGE_CACHE_LOCK_TIMEOUT):
+                if cached is not None:
+                    return cached[1]
+                return view(request, *args, **kwargs)
+            try:
+                response = view(request, *args, **kwargs)
+                # A page with a CSRF token (e.g. the comment form) is only valid for the current token.
+                if response.status_code == 200 and not response.streaming and not request.META.get('CSRF_COOKIE_USED'):
+                    # A replica may not have the write that bumped the version yet.
+                    timeout = settings.POSTS_PAGE_CACHE_TIMEOUT
+                    if reads_from_replica():
+                        timeout = settings.DATABASE_REPLICA_STICKY_SECONDS
+                    if not viewer:
+                        # Lets yatube.pagecache serve the page before Django on the next request.
+                        response.page_cache = (scopes, versions, timeout)
+                    cache.set(key, (versions, response), timeout)
+            finally:
+                cache.delete(lock_key)
+            return response
+        # Tells yatube.pagecache which views it can have pages of.
+        wrapper.page_cache_scope = scope
+        return wrapper
+    return decorator
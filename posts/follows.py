@@ -0,0 +1,89 @@
+from django.db import connection, transaction
+
+from . import inbox, ranking, recommendations
+from .caching import bump_versions, page_scopes
+from .models import Follow, User, UserStats
+
+# ON CONFLICT ... RETURNING (SQLite 3.35+): each statement reports only the rows it really changed,
+# so a repeated or concurrent request changes nothing and counts nothing.
+FOLLOW_SQL = (
+    f'INSERT INTO {Follow._meta.db_table} (user_id, author_id)'
+    f' SELECT %s, id FROM {User._meta.db_table} WHERE username IN ({{}}) AND id != %s'
+    f' ON CONFLICT DO NOTHING RETURNING author_id'
+)
+UNFOLLOW_SQL = (
+    f'DELETE FROM {Follow._meta.db_table} WHERE user_id = %s'
+    f' AND author_id IN (SELECT id FROM {User._meta.db_table} WHERE username IN ({{}}))'
+    f' RETURNING author_id'
+)
+
+
+def supports_returning():
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def execute(sql, user_id, usernames, *params):
+    usernames = sorted(set(usernames))
+    if not usernames:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(', '.join(['%s'] * len(usernames))), [user_id, *usernames, *params])
+        return [author_id for author_id, in cursor.fetchall()]
+
+
+def followed(user_id, author_ids):
+    """
+    Everything that follows from new Follow rows: counters, the inbox,
+    ranking and cached pages in the current transaction, recommendations
+    after the commit. Follow's post_save signal and follow() both use it.
+    """
+    with transaction.atomic(savepoint=False):
+        UserStats.objects.bump_or_recount([user_id], following=len(author_ids))
+        UserStats.objects.bump_or_recount(author_ids, followers=1)
+        # After the counters: whether an author is pushed or pulled depends on them.
+        inbox.follows_changed(user_id, author_ids, followed=True)
+        ranking.record_follows(author_ids)
+        bump_versions(*page_scopes([user_id, *author_ids]))
+        transaction.on_commit(lambda: recommendations.schedule([user_id]))
+
+
+def unfollowed(user_id, author_ids):
+    with transaction.atomic(savepoint=False):
+        # No recount: a missing row here belongs to a user whose deletion cascades to their follows.
+        UserStats.objects.bump_many([user_id], following=-len(author_ids))
+        UserStats.objects.bump_many(author_ids, followers=-1)
+        inbox.follows_changed(user_id, author_ids, followed=False)
+        bump_versions(*page_scopes([user_id, *author_ids]))
+        transaction.on_commit(lambda: recommendations.schedule([user_id]))
+
+
+def follow(user, usernames):
+    """
+    Follows every existing author in usernames except the user and returns
+    the ids of the newly followed ones.
+    """
+    with transaction.atomic():
+        if not supports_returning():
+            # One row at a time; Follow's signals do the rest.
+            authors = User.objects.filter(username__in=set(usernames)).exclude(pk=user.pk)
+            return [
+                author_id for author_id in authors.values_list('pk', flat=True)
+                if Follow.objects.get_or_create(user=user, author_id=author_id)[1]
+            ]
+        author_ids = execute(FOLLOW_SQL, user.pk, usernames, user.pk)
+        if author_ids:
+            followed(user.pk, author_ids)
+    return author_ids
+
+
+def unfollow(user, usernames):
+    with transaction.atomic():
+        if not supports_returning():
+            follows = list(Follow.objects.filter(user=user, author__username__in=set(usernames)))
+            for row in follows:
+                row.delete()
+            return [row.author_id for row in follows]
+        author_ids = execute(UNFOLLOW_SQL, user.pk, usernames)
+        if author_ids:
+            unfollowed(user.pk, author_ids)
+    return author_ids
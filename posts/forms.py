@@ -1,6 +1,9 @@
 from django import forms
+from django.db import transaction
 
+from . import thumbnails
 from .models import Comment, Post
+from .uploads import bound_image
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +11,28 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ['group', 'text', 'image']
 
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if image and 'image' in self.files:
+            return bound_image(image)
+        return image
+
+    def clean(self):
+        for field, message in self.upload_errors.items():
+            self.add_error(field if field in self.fields else None, message)
+        return super().clean()
+
+    def save(self, commit=True):
+        post = super().save(commit)
+        if 'image' in self.changed_data:
+            # With commit=False the file is stored by the caller's post.save(), still before commit.
+            transaction.on_commit(lambda: post.image and thumbnails.schedule(post.image.name))
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import FeedEntry, Follow, Post, UserStats
+
+# follow_feed() rows carry their inbox key, so the cursor pages on the inbox index.
+FEED_ORDERING = ('-inbox_date', '-inbox_post')
+
+
+def is_pull_author(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id, followers__gt=settings.POSTS_FANOUT_FOLLOWER_LIMIT
+    ).exists()
+
+
+def fan_out(post):
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date) for user_id in followers.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_authors(author_ids, user_id=None):
+    author_ids = UserStats.objects.filter(
+        user_id__in=author_ids, followers__lte=settings.POSTS_FANOUT_FOLLOWER_LIMIT
+    ).values_list('user_id', flat=True)
+    push_latest(list(author_ids), user_id=user_id)
+
+
+def push_latest(author_ids, user_id=None):
+    # The latest posts of the authors into the inbox of each of their followers (or only of user_id),
+    # one statement per chunk.
+    for i in range(0, len(author_ids), 500):
+        chunk = author_ids[i:i + 500]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FeedEntry._meta.db_table} (user_id, post_id, pub_date)'
+                f' SELECT f.user_id, p.id, p.pub_date FROM ('
+                f'  SELECT id, author_id, pub_date,'
+                f'   ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS position'
+                f'  FROM {Post._meta.db_table} WHERE author_id IN ({", ".join(["%s"] * len(chunk))})'
+                f' ) p JOIN {Follow._meta.db_table} f ON f.author_id = p.author_id'
+                f' WHERE p.position <= %s{" AND f.user_id = %s" if user_id else ""} ON CONFLICT DO NOTHING',
+                [*chunk, settings.POSTS_INBOX_BACKFILL, *([user_id] if user_id else [])],
+            )
+
+
+def trim(user_id, *author_ids):
+    FeedEntry.objects.filter(user_id=user_id, post__author_id__in=author_ids).delete()
+
+
+def follows_changed(user_id, author_ids, followed):
+    """
+    Inbox side of user_id following or unfollowing author_ids, after the
+    counters. An author whose follower count crosses the fan-out limit
+    switches for all of their followers: going over, their inbox entries are
+    dropped and merged on read; back under, the latest posts are pushed again,
+    since nothing was fanned out in between.
+    """
+    limit = settings.POSTS_FANOUT_FOLLOWER_LIMIT
+    followers = dict(UserStats.objects.filter(user_id__in=author_ids).values_list('user_id', 'followers'))
+    if followed:
+        push_latest([author_id for author_id, count in followers.items() if count <= limit], user_id=user_id)
+        pulled = [author_id for author_id, count in followers.items() if count == limit + 1]
+        if pulled:
+            FeedEntry.objects.filter(post__author_id__in=pulled).delete()
+    else:
+        trim(user_id, *author_ids)
+        pushed = [author_id for author_id, count in followers.items() if count == limit]
+        if pushed:
+            push_latest(pushed)
+
+
+def follow_feed(user):
+    pull_authors = list(Follow.objects.filter(
+        user=user, author__stats__followers__gt=settings.POSTS_FANOUT_FOLLOWER_LIMIT
+    ).values_list('author_id', flat=True))
+    if not pull_authors:
+        return Post.objects.feed().filter(feed_entries__user=user).annotate(
+            inbox_date=F('feed_entries__pub_date'), inbox_post=F('feed_entries__post')
+        ).order_by(*FEED_ORDERING)
+    # Pull authors are merged in at read time: an OR over posts, not a range of the inbox index.
+    inbox = FeedEntry.objects.filter(user=user).values('post')
+    return Post.objects.feed().filter(Q(pk__in=inbox) | Q(author__in=pull_authors)).annotate(
+        inbox_date=F('pub_date'), inbox_post=F('pk')
+    ).order_by(*FEED_ORDERING)
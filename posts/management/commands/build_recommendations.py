@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации авторов для подписки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Только для этих пользователей')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['usernames']:
+            saved = recommendations.refresh(
+                list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+            )
+        else:
+            saved = recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Рекомендаций: {saved} за {time.perf_counter() - started:.1f} с'))
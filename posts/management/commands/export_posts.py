@@ -0,0 +1,30 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Выгружает пользователей, группы, записи, комментарии и подписки в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Файл JSONL, каталог для CSV или - для stdout')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--models', nargs='+', choices=transfer.MODELS, default=transfer.MODELS)
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк на один запрос к базе')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        models = [model for model in transfer.MODELS if model in options['models']]
+        if options['format'] == 'csv':
+            os.makedirs(path, exist_ok=True)
+            counts = transfer.write_csv(path, models, options['chunk_size'])
+        elif path == '-':
+            counts = transfer.write_jsonl(self.stdout, models, options['chunk_size'])
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                counts = transfer.write_jsonl(file, models, options['chunk_size'])
+        # With stdout taken by the data, the summary goes to stderr.
+        output = self.stderr if path == '-' and options['format'] == 'jsonl' else self.stdout
+        output.write(self.style.SUCCESS('Выгружено: ' + ', '.join(f'{model} {counts[model]}' for model in models)))
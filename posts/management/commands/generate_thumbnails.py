@@ -0,0 +1,26 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры для уже загруженных изображений в media/posts/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Число процессов')
+
+    def handle(self, *args, **options):
+        names = []
+        if default_storage.exists('posts'):
+            names = [f'posts/{name}' for name in default_storage.listdir('posts')[1]]
+        # Child processes must not share the parent's database connection.
+        connections.close_all()
+        with ProcessPoolExecutor(options['workers'], initializer=django.setup) as executor:
+            done = sum(executor.map(thumbnails.generate, names, chunksize=16))
+        self.stdout.write(self.style.SUCCESS(f'Создано: {done} из {len(names)}'))
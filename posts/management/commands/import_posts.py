@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает пользователей, группы, записи, комментарии и подписки из JSONL или CSV. '
+        'Каждая пачка записывается в своей транзакции: после ошибки уже загруженные пачки остаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSONL, каталог с CSV (user.csv, post.csv, ...) или - для stdin')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной транзакции')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        importer = transfer.Importer(options['batch_size'])
+        file = None
+        if options['format'] == 'csv':
+            records = transfer.read_csv(path)
+        else:
+            file = sys.stdin if path == '-' else open(path, encoding='utf-8')
+            records = transfer.read_jsonl(file)
+        try:
+            for model, record in records:
+                importer.add(model, record)
+            importer.flush()
+        except (IntegrityError, KeyError, ValueError) as error:
+            raise CommandError(f'Импорт прерван: {error!r}')
+        finally:
+            if file not in (None, sys.stdin):
+                file.close()
+            importer.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Загружено: ' + ', '.join(f'{model} {importer.counts[model]}' for model in transfer.MODELS)
+        ))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import ranking
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из рейтинга популярных записей остывшие записи или пересчитывает его заново'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true', help='Пересчитать по записям и комментариям (без учета подписок)'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(self.style.SUCCESS(f'В рейтинге: {ranking.rebuild()}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Удалено из рейтинга: {ranking.prune()}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс записей и комментариев'
+
+    def handle(self, *args, **options):
+        index = search.get_index()
+        with transaction.atomic():
+            indexed = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{type(index).__name__}: проиндексировано {indexed}'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post, User, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики подписчиков, подписок, записей и комментариев пользователей и их записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Только для этих пользователей')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = list(User.objects.filter(username__in=options['usernames']).values_list('pk', flat=True))
+        updated = UserStats.objects.recount(user_ids)
+        posts = Post.objects.all() if user_ids is None else Post.objects.filter(author_id__in=user_ids)
+        posts.recount_comments()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано: {updated}'))
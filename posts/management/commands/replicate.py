@@ -0,0 +1,37 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def copy_database(source, target):
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        # Consistent snapshot, and readers of the target see either the old or the new copy.
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в реплики с задержкой, для локальной проверки чтения с реплик'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=float, default=1.0, help='Пауза между копиями, секунд')
+        parser.add_argument('--once', action='store_true', help='Скопировать один раз и выйти')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены: задайте YATUBE_DB_REPLICAS')
+        source = settings.DATABASES['default']['NAME']
+        while True:
+            started = time.monotonic()
+            for alias in settings.DATABASE_REPLICAS:
+                copy_database(source, settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'Реплики обновлены за {time.monotonic() - started:.3f} с')
+            if options['once']:
+                return
+            time.sleep(options['lag'])
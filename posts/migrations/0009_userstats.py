@@ -0,0 +1,50 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('posts', 'UserStats')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    counters = {
+        'followers': Follow.objects.values_list('author').annotate(Count('pk')),
+        'following': Follow.objects.values_list('user').annotate(Count('pk')),
+        'posts': Post.objects.values_list('author').annotate(Count('pk')),
+        'comments': Comment.objects.values_list('author').annotate(Count('pk')),
+    }
+    counters = {name: dict(rows.order_by()) for name, rows in counters.items()}
+    UserStats.objects.bulk_create(
+        (
+            UserStats(user_id=pk, **{name: counts.get(pk, 0) for name, counts in counters.items()})
+            for pk in User.objects.values_list('pk', flat=True).iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_auto_20210117_1320'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('followers', models.PositiveIntegerField(default=0)),
+                ('following', models.PositiveIntegerField(default=0)),
+                ('posts', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_inboxes(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    for user_id, author_id in Follow.objects.values_list('user_id', 'author_id').distinct().iterator():
+        posts = Post.objects.filter(author_id=author_id).order_by('-pub_date').values_list('pk', 'pub_date')
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                for post_id, pub_date in posts[:settings.POSTS_INBOX_BACKFILL]
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_userstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='feed_entry_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_inboxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:11
+
+from django.db import OperationalError, migrations, models
+import django.db.models.deletion
+
+
+def create_fts_index(apps, schema_editor):
+    # Without FTS5 (or on another database) search falls back to SearchPosting.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE posts_post_fts USING fts5(text, comments, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        return
+    schema_editor.execute("INSERT INTO posts_post_fts (posts_post_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+    schema_editor.execute('''
+        INSERT INTO posts_post_fts (rowid, text, comments)
+        SELECT p.id, p.text, COALESCE((
+            SELECT group_concat(c.text, ' ') FROM posts_comment c WHERE c.post_id = p.id
+        ), '')
+        FROM posts_post p
+    ''')
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchposting',
+            constraint=models.UniqueConstraint(fields=('term', 'post'), name='unique_search_posting'),
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
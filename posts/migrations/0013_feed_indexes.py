@@ -0,0 +1,82 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+import django.db.models.deletion
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (
+        Follow.objects.values('user', 'author').annotate(first=Min('pk'), copies=Count('pk')).filter(copies__gt=1)
+    )
+    affected = set()
+    for row in duplicates.iterator():
+        Follow.objects.filter(user=row['user'], author=row['author']).exclude(pk=row['first']).delete()
+        affected.update([row['user'], row['author']])
+    for user_id in affected:
+        UserStats.objects.filter(user_id=user_id).update(
+            followers=Follow.objects.filter(author_id=user_id).count(),
+            following=Follow.objects.filter(user_id=user_id).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_searchposting'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['created', 'id']},
+        ),
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ['-pub_date', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='post',
+            field=models.ForeignKey(blank=True, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='posts.Post'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='posts', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='group',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='(необязательно)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posts', to='posts.Group', verbose_name='Выберите группу'),
+        ),
+        migrations.RunPython(remove_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='follower', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    Post = apps.get_model('posts', 'Post')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(count=Count('pk'))
+    Post.objects.update(
+        comment_count=Coalesce(Subquery(comments.values('count'), output_field=models.IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
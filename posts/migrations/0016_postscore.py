@@ -0,0 +1,30 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_recommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.Post')),
+                ('score', models.FloatField()),
+                ('group', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.Group')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-score'], name='post_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['group', '-score'], name='post_score_group_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_postscore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='searchposting',
+            index=models.Index(fields=['term', 'post', 'weight'], name='search_posting_term_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
 User = get_user_model()
 
@@ -13,18 +15,41 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        return self.select_related('author', 'group')
+
+    def recount_comments(self):
+        comments = (
+            Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+            .annotate(count=Count('pk')).values('count')
+        )
+        return self.update(comment_count=Coalesce(Subquery(comments, output_field=models.IntegerField()), 0))
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Введите текст', help_text='Все что хотите')
     pub_date = models.DateTimeField('date published', auto_now_add=True)
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
+    # Both are covered by the leading column of the feed indexes below.
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', db_index=False)
     group = models.ForeignKey(
-        Group, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts',
+        Group, on_delete=models.SET_NULL, blank=True, null=True, related_name='posts', db_index=False,
         verbose_name='Выберите группу', help_text='(необязательно)'
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True, verbose_name='Добавьте изображение')
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # Kept by the comment signals, so pages never count comments.
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         auth = self.author
@@ -33,13 +58,113 @@ class Post(models.Model):
         return f'{auth}. {date}. {text_part}'
 
 
+class PostScore(models.Model):
+    # Log of the time-decayed engagement, see posts.ranking.
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, related_name='+', db_index=False)
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='post_score_idx'),
+            models.Index(fields=['group', '-score'], name='post_score_group_idx'),
+        ]
+
+
 class Comment(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, blank=True, null=False, related_name='comments')
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, blank=True, null=False, related_name='comments', db_index=False
+    )
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     text = models.TextField(verbose_name='Введите комментарий')
     created = models.DateTimeField('created', auto_now_add=True)
 
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [models.Index(fields=['post', 'created'], name='comment_post_created_idx')]
+
 
 class Follow(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follower')
+    # Covered by unique_follow.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follower', db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'author'], name='unique_follow')]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'post'], name='unique_feed_entry')]
+        indexes = [models.Index(fields=['user', '-pub_date', '-post'], name='feed_entry_user_date_idx')]
+
+
+class Recommendation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations', db_index=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommended_to')
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-score'], name='recommendation_user_score_idx')]
+
+
+class UserStatsQuerySet(models.QuerySet):
+    def bump(self, user_id, **deltas):
+        return self.bump_many([user_id], **deltas)
+
+    def bump_many(self, user_ids, **deltas):
+        return self.filter(user_id__in=user_ids).update(
+            **{name: Greatest(F(name) + delta, 0) for name, delta in deltas.items()}
+        )
+
+    def bump_or_recount(self, user_ids, **deltas):
+        # Users without a stats row yet get theirs counted from scratch.
+        if self.bump_many(user_ids, **deltas) < len(set(user_ids)):
+            self.recount(user_ids)
+
+    def recount(self, user_ids=None):
+        users = User.objects.all() if user_ids is None else User.objects.filter(pk__in=user_ids)
+        missing = users.filter(stats__isnull=True).values_list('pk', flat=True)
+        self.bulk_create([self.model(user_id=pk) for pk in missing.iterator()], batch_size=500, ignore_conflicts=True)
+        stats = self if user_ids is None else self.filter(user_id__in=user_ids)
+        return stats.update(**{
+            name: Coalesce(Subquery(
+                model.objects.filter(**{field: OuterRef('user')}).order_by().values(field)
+                .annotate(count=Count('pk')).values('count'),
+                output_field=models.IntegerField()
+            ), 0)
+            for name, model, field in (
+                ('followers', Follow, 'author'),
+                ('following', Follow, 'user'),
+                ('posts', Post, 'author'),
+                ('comments', Comment, 'author'),
+            )
+        })
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    objects = UserStatsQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.user_id}: {self.followers}/{self.following}/{self.posts}/{self.comments}'
+
+
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['term', 'post'], name='unique_search_posting')]
+        # Covers the search query: a term's postings are scored without visiting the table.
+        indexes = [models.Index(fields=['term', 'post', 'weight'], name='search_posting_term_idx')]
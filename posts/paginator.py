@@ -0,0 +1,150 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+PER_PAGE = 10
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def dump_cursor(direction, values):
+    raw = json.dumps([direction] + list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def load_cursor(cursor):
+    if not cursor:
+        raise InvalidCursor
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, *values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor
+    if direction not in (NEXT, PREVIOUS):
+        raise InvalidCursor
+    return direction, values
+
+
+class CursorPage:
+    cursor_mode = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: every page is a range read on `ordering` that starts
+    right after the row encoded in the cursor, so no COUNT(*) and no OFFSET.
+    The last ordering field must be unique to make the key a total order.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def get_page(self, cursor):
+        try:
+            direction, values = self.decode_cursor(cursor)
+        except InvalidCursor:
+            direction, values = NEXT, None
+
+        reverse = direction == PREVIOUS
+        queryset = self.object_list.order_by(*self._ordering(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(NEXT, rows[-1])
+            if (has_more and reverse) or (values is not None and not reverse):
+                previous_cursor = self.encode_cursor(PREVIOUS, rows[0])
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def encode_cursor(self, direction, obj):
+        # Rows of a values() queryset are dicts.
+        values = [obj[name] if isinstance(obj, dict) else getattr(obj, name) for name, _ in self.fields]
+        return dump_cursor(direction, [str(value) for value in values])
+
+    def decode_cursor(self, cursor):
+        direction, values = load_cursor(cursor)
+        if len(values) != len(self.fields):
+            raise InvalidCursor
+        try:
+            values = [self._field(name).to_python(value) for (name, _), value in zip(self.fields, values)]
+        except ValidationError:
+            raise InvalidCursor
+        if any(value is None for value in values):
+            raise InvalidCursor
+        return direction, values
+
+    def _field(self, name):
+        opts = self.object_list.model._meta
+        if name == 'pk':
+            return opts.pk
+        # An annotation, e.g. a column of a joined table.
+        if name in self.object_list.query.annotations:
+            return self.object_list.query.annotations[name].output_field
+        return opts.get_field(name)
+
+    def _ordering(self, reverse):
+        return [name if desc == reverse else f'-{name}' for name, desc in self.fields]
+
+    def _after(self, values, reverse):
+        condition = Q()
+        for i, (name, desc) in enumerate(self.fields):
+            lookup = 'lt' if desc != reverse else 'gt'
+            equal = {prev_name: values[j] for j, (prev_name, _) in enumerate(self.fields[:i])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        return condition
+
+
+def paginate(request, queryset, per_page=PER_PAGE, ordering=('-pub_date', '-pk')):
+    cursor = request.GET.get('cursor')
+    if cursor is None and (request.GET.get('page') or not settings.POSTS_CURSOR_PAGINATION):
+        paginator = Paginator(queryset, per_page)
+        return paginator, paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(queryset, per_page, ordering)
+    return paginator, paginator.get_page(cursor)
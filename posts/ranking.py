@@ -0,0 +1,102 @@
+import math
+import time
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from yatube.db.base import logaddexp
+
+from .caching import bump_versions
+from .models import Comment, Post, PostScore, User
+
+# What one event adds to a post before it decays.
+WEIGHTS = {'post': 1.0, 'comment': 2.0, 'follow': 4.0}
+# Posts whose decayed engagement fell below this are dropped by prune().
+PRUNE_WEIGHT = 0.01
+
+UPSERT_SQL = (
+    f'INSERT INTO {PostScore._meta.db_table} (post_id, group_id, score)'
+    f' SELECT id, group_id, %s FROM {Post._meta.db_table} WHERE {{}}'
+    f' ON CONFLICT (post_id) DO UPDATE SET score = logaddexp(score, excluded.score)'
+)
+INSERT_SQL = f'INSERT INTO {PostScore._meta.db_table} (post_id, group_id, score) VALUES (%s, %s, %s)'
+
+
+def event_score(weight, when=None):
+    """
+    log(weight * 2 ** (t / half-life)). Decay shrinks every post's
+    engagement by the same factor, so instead of decaying the stored scores,
+    newer events weigh more: the stored order never goes stale, and an event
+    is a single logaddexp on its post's row.
+    """
+    timestamp = when.timestamp() if when else time.time()
+    return math.log(weight) + timestamp * math.log(2) / settings.POSTS_TRENDING_HALF_LIFE
+
+
+def record(kind, post_id, when=None):
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format('id = %s'), [event_score(WEIGHTS[kind], when), post_id])
+    bump_versions('popular')
+
+
+def record_follows(author_ids, when=None):
+    # A new follower counts for the author's latest post.
+    author_ids = sorted(author_ids)
+    for i in range(0, len(author_ids), 500):
+        chunk = author_ids[i:i + 500]
+        where = (
+            f'id IN (SELECT (SELECT id FROM {Post._meta.db_table} WHERE author_id = author.id'
+            f' ORDER BY pub_date DESC, id DESC LIMIT 1) FROM {User._meta.db_table} author'
+            f' WHERE author.id IN ({", ".join(["%s"] * len(chunk))}))'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL.format(where), [event_score(WEIGHTS['follow'], when), *chunk])
+    bump_versions('popular')
+
+
+def record_scores(scores):
+    # {post id: score} from event_score(), e.g. one batch of a bulk import; prune() drops the negligible ones.
+    if scores:
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL.format('id = %s'), [(score, pk) for pk, score in sorted(scores.items())])
+        bump_versions('popular')
+
+
+def top(group_id=None, limit=None):
+    scores = PostScore.objects.select_related('post__author', 'post__group').order_by('-score')
+    if group_id is not None:
+        scores = scores.filter(group_id=group_id)
+    return [score.post for score in scores[:limit or settings.POSTS_TRENDING_SIZE]]
+
+
+def prune():
+    # The site-wide top always stays, so a quiet site still has a popular page.
+    size = settings.POSTS_TRENDING_SIZE
+    last = PostScore.objects.order_by('-score').values_list('score', flat=True)[size - 1:size]
+    threshold = min([event_score(PRUNE_WEIGHT), *last])
+    return PostScore.objects.filter(score__lt=threshold).delete()[0]
+
+
+def rebuild():
+    """
+    Recomputes the scores from posts and comments. Follows have no date,
+    so what they added is lost.
+    """
+    scores, groups = {}, {}
+    for pk, group_id, pub_date in Post.objects.values_list('pk', 'group_id', 'pub_date').iterator(chunk_size=10000):
+        scores[pk], groups[pk] = event_score(WEIGHTS['post'], pub_date), group_id
+    for post_id, created in Comment.objects.values_list('post_id', 'created').iterator(chunk_size=10000):
+        scores[post_id] = logaddexp(scores[post_id], event_score(WEIGHTS['comment'], created))
+    threshold = event_score(PRUNE_WEIGHT)
+    ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+    rows = [
+        (pk, groups[pk], score) for position, (pk, score) in enumerate(ranked)
+        if score >= threshold or position < settings.POSTS_TRENDING_SIZE
+    ]
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_SQL, rows)
+    bump_versions('popular')
+    return len(rows)
@@ -0,0 +1,161 @@
+import logging
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Follow, Recommendation
+
+logger = logging.getLogger(__name__)
+
+EMPTY = array('q')
+INSERT_SQL = f'INSERT INTO {Recommendation._meta.db_table} (user_id, author_id, score) VALUES (%s, %s, %s)'
+
+_executor = None
+
+
+class FollowGraph:
+    """
+    The follow graph as arrays of ids per user, both ways, each in follow
+    order, so the latest follows are at the end.
+    """
+
+    def __init__(self, edges):
+        self.following = defaultdict(lambda: array('q'))
+        self.followers = defaultdict(lambda: array('q'))
+        for user_id, author_id in edges:
+            self.following[user_id].append(author_id)
+            self.followers[author_id].append(user_id)
+
+    @classmethod
+    def load(cls):
+        return cls(Follow.objects.order_by('pk').values_list('user_id', 'author_id').iterator(chunk_size=10000))
+
+    @classmethod
+    def around(cls, user_ids, sample):
+        """
+        Only the edges recommend() reads for these users: all their follows,
+        and the latest `sample` edges of every node it walks through.
+        """
+        edges = {pk: (user_id, author_id) for pk, user_id, author_id in (
+            Follow.objects.filter(user_id__in=user_ids).order_by('pk').values_list('pk', 'user_id', 'author_id')
+        )}
+        following = defaultdict(list)
+        for user_id, author_id in edges.values():
+            following[user_id].append(author_id)
+        friends = {author_id for follows in following.values() for author_id in follows[-sample:]}
+        edges.update(latest_edges('user_id', friends, sample))
+        co_follows = latest_edges('author_id', friends, sample)
+        edges.update(co_follows)
+        edges.update(latest_edges('user_id', {user_id for user_id, author_id in co_follows.values()}, sample))
+        return cls(edges[pk] for pk in sorted(edges))
+
+    def latest_following(self, user_id, sample):
+        return self.following.get(user_id, EMPTY)[-sample:]
+
+    def latest_followers(self, author_id, sample):
+        return self.followers.get(author_id, EMPTY)[-sample:]
+
+
+def latest_edges(column, ids, limit):
+    # {follow id: (user_id, author_id)} of the latest `limit` follows of each id in `column`. One
+    # index-ordered LIMIT per id: a window over all followers of a popular author would sort them all.
+    edges = {}
+    ids = sorted(ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        select = (
+            f'SELECT * FROM (SELECT id, user_id, author_id FROM {Follow._meta.db_table}'
+            f' WHERE {column} = %s ORDER BY id DESC LIMIT %s)'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(' UNION ALL '.join([select] * len(chunk)), [value for pk in chunk for value in (pk, limit)])
+            edges.update((pk, (user_id, author_id)) for pk, user_id, author_id in cursor.fetchall())
+    return edges
+
+
+class Recommender:
+    """
+    Scores an author for a user by how many of the user's latest follows
+    follow that author (friends of friends) and by how many of them have it
+    among their most co-followed authors (followed by the same people).
+    Each walk looks at the latest `sample` edges of a node only, so popular
+    authors and mass followers cost as much as everyone else.
+    """
+
+    def __init__(self, graph, limit=None, sample=None, similar=None):
+        self.graph = graph
+        self.limit = limit or settings.POSTS_RECOMMENDATIONS
+        self.sample = sample or settings.POSTS_RECOMMENDATION_SAMPLE
+        self.similar_limit = similar or settings.POSTS_RECOMMENDATIONS
+        self.similar_authors = {}
+
+    def similar(self, author_id):
+        similar = self.similar_authors.get(author_id)
+        if similar is None:
+            counts = Counter()
+            for user_id in self.graph.latest_followers(author_id, self.sample):
+                counts.update(self.graph.latest_following(user_id, self.sample))
+            del counts[author_id]
+            similar = self.similar_authors[author_id] = [pk for pk, count in counts.most_common(self.similar_limit)]
+        return similar
+
+    def recommend(self, user_id):
+        counts = Counter()
+        for friend_id in self.graph.latest_following(user_id, self.sample):
+            counts.update(self.graph.latest_following(friend_id, self.sample))
+            counts.update(self.similar(friend_id))
+        for author_id in (user_id, *self.graph.following.get(user_id, EMPTY)):
+            del counts[author_id]
+        return counts.most_common(self.limit)
+
+
+def save(recommendations):
+    rows = [
+        (user_id, author_id, score)
+        for user_id, authors in recommendations.items() for author_id, score in authors
+    ]
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=list(recommendations)).delete()
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+def rebuild(batch_size=1000):
+    """
+    Recomputes every user's recommendations from the whole graph, writing
+    them in batches of users so that each write transaction stays short.
+    """
+    recommender = Recommender(FollowGraph.load())
+    user_ids = sorted(recommender.graph.following)
+    saved = 0
+    for i in range(0, len(user_ids), batch_size):
+        saved += save({user_id: recommender.recommend(user_id) for user_id in user_ids[i:i + batch_size]})
+    Recommendation.objects.exclude(user_id__in=Follow.objects.values('user_id')).delete()
+    return saved
+
+
+def refresh(user_ids):
+    recommender = Recommender(FollowGraph.around(user_ids, settings.POSTS_RECOMMENDATION_SAMPLE))
+    return save({user_id: recommender.recommend(user_id) for user_id in user_ids})
+
+
+def _refresh_in_worker(user_ids):
+    try:
+        return refresh(user_ids)
+    except Exception:
+        logger.exception('Не удалось обновить рекомендации для %s', user_ids)
+    finally:
+        connection.close()
+
+
+def schedule(user_ids):
+    global _executor
+    if not settings.POSTS_RECOMMENDATION_WORKERS:
+        return refresh(user_ids)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.POSTS_RECOMMENDATION_WORKERS, thread_name_prefix='recommendations')
+    return _executor.submit(_refresh_in_worker, user_ids)
@@ -0,0 +1,233 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+
+from .models import Comment, Post, SearchPosting
+from .paginator import NEXT, PREVIOUS, CursorPage, InvalidCursor, dump_cursor, load_cursor
+
+FTS_TABLE = 'posts_post_fts'
+TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+# Post text counts twice as much as the text of its comments.
+TEXT_WEIGHT = 2
+COMMENTS_WEIGHT = 1
+MAX_TERMS = 32
+
+_fts_available = None
+_ln_available = None
+
+
+def tokenize(text):
+    return [term[:TERM_LENGTH] for term in re.findall(r'\w+', text.casefold())]
+
+
+def fts_available():
+    global _fts_available
+    if settings.POSTS_SEARCH_BACKEND == 'postings' or connection.vendor != 'sqlite':
+        return False
+    if _fts_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def ln_available():
+    """Whether SQLite was built with its math functions; log1p() is registered in Python otherwise."""
+    global _ln_available
+    if _ln_available is None:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT ln(1)')
+            _ln_available = True
+        except OperationalError:
+            _ln_available = False
+    return _ln_available
+
+
+class Fts5Index:
+    """
+    SQLite FTS5 table keyed by post id, with the post text and its comments as columns.
+    """
+
+    document_sql = f'''
+        SELECT p.id, p.text, COALESCE((
+            SELECT group_concat(c.text, ' ') FROM {Comment._meta.db_table} c WHERE c.post_id = p.id
+        ), '')
+        FROM {Post._meta.db_table} p
+    '''
+
+    def update(self, post_ids):
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text, comments) {self.document_sql} WHERE p.id IN ({placeholders})',
+                post_ids,
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, text, comments) {self.document_sql}')
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+    def search(self, terms, after, reverse, limit):
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        sql = f'SELECT rank, rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [match]
+        if after is not None:
+            compare = '<' if reverse else '>'
+            sql += f' AND (rank {compare} %s OR (rank = %s AND rowid {compare} %s))'
+            params += [after[0], after[0], after[1]]
+        order = 'DESC' if reverse else 'ASC'
+        sql += f' ORDER BY rank {order}, rowid {order} LIMIT %s'
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(sql, params + [limit])
+            except OperationalError:
+                return []
+            return cursor.fetchall()
+
+
+class PostingsIndex:
+    """
+    Inverted index kept in SearchPosting rows, for databases without FTS5.
+
+    Scores are negated tf-idf sums, so that lower is better as with FTS5 rank.
+    """
+
+    def postings(self, posts):
+        for post in posts:
+            weights = Counter()
+            for term in tokenize(post.text):
+                weights[term] += TEXT_WEIGHT
+            for comment in post.comments.all():
+                for term in tokenize(comment.text):
+                    weights[term] += COMMENTS_WEIGHT
+            for term, weight in weights.items():
+                yield SearchPosting(term=term, post_id=post.pk, weight=weight)
+
+    def update(self, post_ids):
+        SearchPosting.objects.filter(post_id__in=post_ids).delete()
+        posts = Post.objects.filter(pk__in=post_ids).prefetch_related('comments')
+        SearchPosting.objects.bulk_create(self.postings(posts), batch_size=500)
+
+    def rebuild(self, batch_size=1000):
+        SearchPosting.objects.all().delete()
+        indexed = last = 0
+        while True:
+            posts = list(Post.objects.filter(pk__gt=last).order_by('pk').prefetch_related('comments')[:batch_size])
+            if not posts:
+                return indexed
+            SearchPosting.objects.bulk_create(self.postings(posts), batch_size=500)
+            indexed += len(posts)
+            last = posts[-1].pk
+
+    def search(self, terms, after, reverse, limit):
+        frequencies = dict(
+            SearchPosting.objects.filter(term__in=terms).order_by().values_list('term').annotate(Count('pk'))
+        )
+        if len(frequencies) < len(terms):
+            return []
+        total = Post.objects.count()
+        # The rarest term's postings drive the query and every other term is an index lookup per post;
+        # SQLite scores, sorts and cuts the page, so only the page's rows come back.
+        terms = sorted(terms, key=frequencies.get)
+        table = SearchPosting._meta.db_table
+        log_weight = 'ln(1 + p{0}.weight)' if ln_available() else 'log1p(p{0}.weight)'
+        score = ' + '.join(f'{log_weight.format(i)} * %s' for i in range(len(terms)))
+        joins = ''.join(
+            f' JOIN {table} p{i} ON p{i}.term = %s AND p{i}.post_id = p0.post_id' for i in range(1, len(terms))
+        )
+        sql = (
+            f'SELECT score, post_id FROM ('
+            f'SELECT -({score}) AS score, p0.post_id AS post_id FROM {table} p0{joins} WHERE p0.term = %s'
+            f')'
+        )
+        params = [math.log(1 + total / frequencies[term]) for term in terms] + terms[1:] + terms[:1]
+        if after is not None:
+            compare = '<' if reverse else '>'
+            sql += f' WHERE score {compare} %s OR (score = %s AND post_id {compare} %s)'
+            params += [after[0], after[0], after[1]]
+        order = 'DESC' if reverse else 'ASC'
+        sql += f' ORDER BY score {order}, post_id {order} LIMIT %s'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit])
+            return cursor.fetchall()
+
+
+def get_index():
+    return Fts5Index() if fts_available() else PostingsIndex()
+
+
+def update_posts(post_ids):
+    post_ids = [pk for pk in post_ids if pk]
+    if post_ids:
+        with transaction.atomic():
+            get_index().update(post_ids)
+
+
+class PendingUpdate:
+    def __init__(self, post_ids):
+        self.post_ids = set(post_ids)
+
+    def __call__(self):
+        # Posts deleted meanwhile dropped out of the index with their own delete.
+        post_ids = list(Post.objects.filter(pk__in=self.post_ids).values_list('pk', flat=True))
+        if post_ids:
+            update_posts(post_ids)
+
+
+def schedule_update(post_id):
+    """
+    Re-indexes the post once the transaction commits. Every comment write
+    rebuilds its post's document, so comments written in one transaction
+    cost one update, and those deleted along with their post cost none.
+    """
+    pending = next((callback for _, callback in connection.run_on_commit if isinstance(callback, PendingUpdate)), None)
+    if pending is not None:
+        pending.post_ids.add(post_id)
+    else:
+        transaction.on_commit(PendingUpdate([post_id]))
+
+
+class SearchPaginator:
+    """
+    Keyset pagination over (rank, post id), like CursorPaginator but for index results.
+    """
+
+    def __init__(self, query, per_page):
+        # Each term is a join in PostingsIndex, and SQLite allows at most 64 tables in one.
+        self.terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+        self.per_page = int(per_page)
+
+    def get_page(self, cursor):
+        try:
+            direction, after = load_cursor(cursor)
+            if len(after) != 2:
+                raise InvalidCursor
+            after = (float(after[0]), int(after[1]))
+        except (InvalidCursor, TypeError, ValueError):
+            direction, after = NEXT, None
+        reverse = direction == PREVIOUS
+        rows = get_index().search(self.terms, after, reverse, self.per_page + 1) if self.terms else []
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        posts = Post.objects.feed().in_bulk([post_id for _, post_id in rows])
+        object_list = [posts[post_id] for _, post_id in rows if post_id in posts]
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = dump_cursor(NEXT, rows[-1])
+            if (has_more and reverse) or (after is not None and not reverse):
+                previous_cursor = dump_cursor(PREVIOUS, rows[0])
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
@@ -0,0 +1,165 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import follows, inbox, ranking, search
+from .caching import bump_versions, page_scopes
+from .models import Comment, Follow, Group, Post, PostScore, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump_or_recount([instance.author_id], posts=1)
+        inbox.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, posts=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump_or_recount([instance.author_id], comments=1)
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, comments=-1)
+    Post.objects.filter(pk=instance.post_id).update(comment_count=Greatest(F('comment_count') - 1, 0))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.followed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, [instance.author_id])
+
+
+@receiver(pre_save, sender=Post)
+def bump_post_version(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        old = Post.objects.filter(pk=instance.pk).values_list('group_id', 'version', 'comment_count').first()
+        if old is not None:
+            instance._old_group_id = old[0]
+            instance.version = old[1] + 1
+            # The instance may have been loaded before comments were added.
+            instance.comment_count = old[2]
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        group_ids = [instance.group_id, getattr(instance, '_old_group_id', None)]
+        bump_versions('index', 'popular', *page_scopes([instance.author_id], group_ids))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Post.objects.filter(pk=instance.post_id).update(version=F('version') + 1)
+        post = Post.objects.filter(pk=instance.post_id).values_list('author_id', 'group_id').first()
+        if post is not None:
+            bump_versions('index', *page_scopes([post[0]], [post[1]]))
+
+
+@receiver(post_save, sender=Post)
+def rank_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ranking.record('post', instance.pk, instance.pub_date)
+    elif getattr(instance, '_old_group_id', None) != instance.group_id:
+        PostScore.objects.filter(post_id=instance.pk).update(group_id=instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def rank_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ranking.record('comment', instance.post_id, instance.created)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance.pk and not raw and set(update_fields or ()) != {'last_login'}:
+        instance._old_names = User.objects.filter(pk=instance.pk).values_list(
+            'username', 'first_name', 'last_name'
+        ).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_profile_page(sender, instance, raw=False, update_fields=None, **kwargs):
+    # A new or renamed user may take a username whose page is still cached; logins change nothing shown.
+    if raw or set(update_fields or ()) == {'last_login'}:
+        return
+    scopes = [f'profile:{instance.username}']
+    old = getattr(instance, '_old_names', None)
+    if old is not None and old != (instance.username, instance.first_name, instance.last_name):
+        # Post cards show the author's names.
+        group_ids = Post.objects.filter(author=instance).order_by().values_list('group_id', flat=True).distinct()
+        scopes += [f'profile:{old[0]}', 'index', 'popular', *page_scopes(group_ids=group_ids)]
+    bump_versions(*scopes)
+
+
+def group_author_ids(group_id):
+    return Post.objects.filter(group_id=group_id).order_by().values_list('author_id', flat=True).distinct()
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_names(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._old_names = Group.objects.filter(pk=instance.pk).values_list('slug', 'title').first()
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_page(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    scopes = [f'group:{instance.slug}']
+    old = getattr(instance, '_old_names', None)
+    if old is not None and old != (instance.slug, instance.title):
+        # Post cards show the group: every page listing its posts changes.
+        scopes += [f'group:{old[0]}', 'index', 'popular', *page_scopes(group_author_ids(instance.pk))]
+    bump_versions(*scopes)
+
+
+@receiver(pre_delete, sender=Group)
+def remember_group_authors(sender, instance, **kwargs):
+    # Before the posts lose their group: SET_NULL is a plain UPDATE without signals.
+    instance._author_ids = list(group_author_ids(instance.pk))
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_deleted_group_pages(sender, instance, **kwargs):
+    bump_versions(f'group:{instance.slug}', 'index', 'popular', *page_scopes(instance._author_ids))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.update_posts([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.schedule_update(instance.post_id)
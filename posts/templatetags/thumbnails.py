@@ -0,0 +1,12 @@
+from django import template
+
+from posts.thumbnails import backend
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(file_, geometry, **options):
+    if not file_:
+        return None
+    return backend.get_cached_thumbnail(file_, geometry, **options)
@@ -1,12 +1,22 @@
+import re
 import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from PIL import Image
 
-from .models import Follow, Group, Post, User
+from . import ranking, recommendations, search, thumbnails
+from .caching import bump_versions
+from .models import Comment, FeedEntry, Follow, Group, Post, PostScore, Recommendation, User, UserStats
 
 
 class TestProfile(TestCase):
@@ -102,18 +112,40 @@ class TestProfile(TestCase):
         self.assertEqual(response.status_code, 404)
 
     def test_cache_index(self):
+        post = Post.objects.create(text='Старый текст', author=self.user)
         response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, 'Старый текст')
+        Post.objects.filter(pk=post.pk).update(text='Обновлен в обход сигналов')
+        response = self.authorized_client.get(reverse('index'))
+        self.assertContains(response, 'Старый текст')
         text_for_post = 'Тест для проверки кэша'
-        self.assertNotContains(response, text_for_post)
-        new_post = self.authorized_client.post(
+        self.authorized_client.post(
             reverse('new_post'), {'text': text_for_post, 'author': self.user, 'group': self.group.pk}
         )
         response = self.authorized_client.get(reverse('index'))
-        self.assertNotContains(response, text_for_post)
-        cache.clear()
-        response = self.authorized_client.get(reverse('index'))
         self.assertContains(response, text_for_post)
 
+    def test_cache_serves_stale_page_while_rebuilding(self):
+        Post.objects.create(text='Старый текст', author=self.user)
+        self.client.get(reverse('profile', args=[self.user.username]))
+        Post.objects.create(text='Новый текст', author=self.user)
+        with mock.patch.object(cache, 'add', return_value=False):
+            response = self.client.get(reverse('profile', args=[self.user.username]))
+        self.assertNotContains(response, 'Новый текст')
+        response = self.client.get(reverse('profile', args=[self.user.username]))
+        self.assertContains(response, 'Новый текст')
+
+    def test_group_cache_follows_post_edit(self):
+        other = Group.objects.create(title='Other', slug='other', description='Other')
+        post = Post.objects.create(text='Текст для переноса', author=self.user, group=self.group)
+        self.assertContains(self.client.get(reverse('group_posts', args=[self.group.slug])), post.text)
+        self.assertNotContains(self.client.get(reverse('group_posts', args=[other.slug])), post.text)
+        self.authorized_client.post(
+            reverse('post_edit', args=[self.user.username, post.pk]), {'text': post.text, 'group': other.pk}
+        )
+        self.assertNotContains(self.client.get(reverse('group_posts', args=[self.group.slug])), post.text)
+        self.assertContains(self.client.get(reverse('group_posts', args=[other.slug])), post.text)
+
     def test_auth_follow(self):
         new_user = User.objects.create_user(username='second', email='testmail@testmail.com', password='testtest')
         response = self.authorized_client.post(reverse('profile_follow', args=[new_user]),follow=True)
@@ -240,4 +272,887 @@ class TestProfileImage(TestCase):
         self.assertFormError(
             response, 'form', 'image', 'Загрузите правильное изображение. '
             'Файл, который вы загрузили, поврежден или не является изображением.'
-        )
\ No newline at end of file
+        )
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='Test', description='Test')
+        for i in range(25):
+            Post.objects.create(text=f'Пост {i}', author=self.user, group=self.group)
+        cache.clear()
+
+    def walk(self, url):
+        seen = []
+        response = self.client.get(url, {'cursor': ''})
+        while True:
+            page = response.context['page']
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                return seen, page
+            response = self.client.get(url, {'cursor': page.next_cursor})
+
+    def test_cursor_walks_all_posts(self):
+        expected = list(Post.objects.order_by('-pub_date', '-pk').values_list('pk', flat=True))
+        for url in (
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': self.group.slug}),
+            reverse('profile', kwargs={'username': self.user.username}),
+        ):
+            seen, last_page = self.walk(url)
+            self.assertEqual(seen, expected)
+            self.assertEqual(len(last_page), 5)
+
+    def test_cursor_walks_follow_feed(self):
+        reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        expected = list(Post.objects.order_by('-pub_date', '-pk').values_list('pk', flat=True))
+        self.assertEqual(self.walk(reverse('follow_index'))[0], expected)
+        # An author over the fan-out limit is merged in on read, with the same cursor.
+        with self.settings(POSTS_FANOUT_FOLLOWER_LIMIT=0):
+            self.assertEqual(self.walk(reverse('follow_index'))[0], expected)
+
+    def test_cursor_previous_page(self):
+        first = self.client.get(reverse('profile', args=[self.user.username]), {'cursor': ''}).context['page']
+        self.assertFalse(first.has_previous())
+        second = self.client.get(
+            reverse('profile', args=[self.user.username]), {'cursor': first.next_cursor}
+        ).context['page']
+        back = self.client.get(
+            reverse('profile', args=[self.user.username]), {'cursor': second.previous_cursor}
+        ).context['page']
+        self.assertEqual([post.pk for post in back], [post.pk for post in first])
+        self.assertFalse(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_invalid_cursor_is_first_page(self):
+        response = self.client.get(reverse('profile', args=[self.user.username]), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'][0], Post.objects.order_by('-pub_date', '-pk').first())
+
+    def test_deep_page_skips_count_and_offset(self):
+        url = reverse('group_posts', kwargs={'slug': self.group.slug})
+        cursor = self.client.get(url, {'cursor': ''}).context['page'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual(len(response.context['page']), 10)
+        for query in queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='Test', description='Test')
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.add_posts(3)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Пост {i}', author=self.user, group=self.group)
+            Comment.objects.create(post=post, author=self.reader, text='Комментарий')
+
+    def assert_queries_flat(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            client.get(url)
+        self.add_posts(7)
+        cache.clear()
+        with CaptureQueriesContext(connection) as full:
+            response = client.get(url)
+        self.assertEqual(len(response.context['page']), 10)
+        self.assertContains(response, '1 комментариев')
+        self.assertEqual(len(full), len(small), [query['sql'] for query in full])
+        return len(full)
+
+    def test_index_queries(self):
+        self.assertEqual(self.assert_queries_flat(self.client, reverse('index')), 2)
+
+    def test_group_queries(self):
+        self.assertEqual(self.assert_queries_flat(self.client, reverse('group_posts', args=[self.group.slug])), 3)
+
+    def test_profile_queries(self):
+        self.assertEqual(self.assert_queries_flat(self.client, reverse('profile', args=[self.user.username])), 3)
+
+    def test_follow_queries(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.assert_queries_flat(self.client, reverse('follow_index')), 6)
+
+
+class TestUserStats(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.author = User.objects.create_user(username='author', email='author@testmail.com', password='test1234')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_rows(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(post=post, author=self.user, text='Комментарий')
+        self.assertEqual(self.stats(self.author).followers, 1)
+        self.assertEqual(self.stats(self.author).posts, 1)
+        self.assertEqual(self.stats(self.user).following, 1)
+        self.assertEqual(self.stats(self.user).comments, 1)
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).followers, 0)
+        self.assertEqual(self.stats(self.author).posts, 0)
+        self.assertEqual(self.stats(self.user).following, 0)
+        self.assertEqual(self.stats(self.user).comments, 0)
+
+    def test_recount_fixes_drift(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Текст', author=self.author)
+        UserStats.objects.update(followers=42, posts=0)
+        UserStats.objects.filter(user=self.user).delete()
+        call_command('recount_stats', stdout=StringIO())
+        self.assertEqual(self.stats(self.author).followers, 1)
+        self.assertEqual(self.stats(self.author).posts, 1)
+        self.assertEqual(self.stats(self.user).following, 1)
+
+    def test_profile_reads_counters(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(reverse('profile', args=[self.author.username]))
+        self.assertContains(response, 'Подписчиков: 1')
+
+
+class TestFollowInbox(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.author = User.objects.create_user(username='author', email='author@testmail.com', password='test1234')
+        self.client.force_login(self.user)
+
+    def follow_page(self):
+        return [post.text for post in self.client.get(reverse('follow_index')).context['page']]
+
+    def test_fan_out_and_backfill(self):
+        Post.objects.create(text='До подписки', author=self.author)
+        self.client.get(reverse('profile_follow', args=[self.author.username]))
+        Post.objects.create(text='После подписки', author=self.author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.follow_page(), ['После подписки', 'До подписки'])
+        self.client.get(reverse('profile_unfollow', args=[self.author.username]))
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [])
+
+    @override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=0)
+    def test_popular_author_merged_on_read(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Популярный автор', author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.follow_page(), ['Популярный автор'])
+
+    @override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=1)
+    def test_crossing_the_fan_out_limit(self):
+        reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Разослан', author=self.author)
+        self.assertEqual(FeedEntry.objects.count(), 1)
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        Post.objects.create(text='Читается при показе', author=self.author)
+        self.assertEqual(self.follow_page(), ['Читается при показе', 'Разослан'])
+        Follow.objects.get(user=reader).delete()
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(self.follow_page(), ['Читается при показе', 'Разослан'])
+
+    @override_settings(POSTS_FANOUT_FOLLOWER_LIMIT=0)
+    def test_deleting_author_at_the_limit(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text='Популярный автор', author=self.author)
+        self.author.delete()
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [])
+
+
+class TestFollowOperations(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.authors = [
+            User.objects.create_user(username=f'author{i}', email=f'author{i}@testmail.com', password='test1234')
+            for i in range(3)
+        ]
+        for author in self.authors:
+            Post.objects.create(text=f'Запись {author.username}', author=author)
+        self.client.force_login(self.user)
+
+    def counters(self):
+        return [UserStats.objects.get(user=user).followers for user in self.authors], (
+            UserStats.objects.get(user=self.user).following
+        )
+
+    def test_repeated_follow_and_unfollow_are_noops(self):
+        for _ in range(2):
+            response = self.client.get(reverse('profile_follow', args=['author0']))
+            self.assertRedirects(response, reverse('profile', args=['author0']))
+        self.assertEqual(self.counters(), ([1, 0, 0], 1))
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 1)
+        for _ in range(2):
+            response = self.client.get(reverse('profile_unfollow', args=['author0']))
+            self.assertRedirects(response, reverse('profile', args=['author0']))
+        self.assertEqual(self.counters(), ([0, 0, 0], 0))
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.client.get(reverse('profile_follow', args=['nobody'])).status_code, 404)
+
+    def test_follow_statement_count(self):
+        # User (until it is cached), author, then one write statement per table inside a savepoint.
+        with self.assertNumQueries(11):
+            self.client.get(reverse('profile_follow', args=['author0']))
+        with self.assertNumQueries(4):
+            self.client.get(reverse('profile_follow', args=['author0']))
+
+    def test_bulk_follow_and_unfollow(self):
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        usernames = ['author0', 'author1', 'author2', 'Test_user', 'nobody']
+        response = self.client.post(reverse('follow_authors'), {'author': usernames})
+        self.assertRedirects(response, reverse('follow_index'))
+        self.assertEqual(self.counters(), ([1, 1, 1], 3))
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 3)
+        self.client.post(reverse('follow_authors'), {'author': ['author1', 'author2'], 'action': 'unfollow'})
+        self.assertEqual(self.counters(), ([1, 0, 0], 1))
+        self.assertEqual(list(FeedEntry.objects.values_list('post__author__username', flat=True)), ['author0'])
+        self.assertEqual(self.client.get(reverse('follow_authors')).status_code, 405)
+
+    def test_bulk_follow_without_returning(self):
+        # SQLite before 3.35: rows one by one, side effects through the Follow signals.
+        with mock.patch('posts.follows.supports_returning', return_value=False):
+            self.test_bulk_follow_and_unfollow()
+
+
+@override_settings(POSTS_RECOMMENDATION_WORKERS=0)
+class TestRecommendations(TestCase):
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(username=name, email=f'{name}@testmail.com', password='test1234')
+            for name in ('reader', 'friend', 'other', 'fof', 'cofollowed', 'stranger')
+        }
+        for user, author in [
+            ('reader', 'friend'), ('friend', 'fof'), ('friend', 'reader'),
+            ('other', 'friend'), ('other', 'cofollowed'), ('other', 'fof'),
+        ]:
+            Follow.objects.create(user=self.users[user], author=self.users[author])
+
+    def recommended(self, name):
+        return list(
+            Recommendation.objects.filter(user=self.users[name]).order_by('-score', 'author__username')
+            .values_list('author__username', 'score')
+        )
+
+    def test_friends_of_friends_and_co_follows(self):
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(self.recommended('reader'), [('fof', 2), ('cofollowed', 1)])
+        self.assertEqual(self.recommended('stranger'), [])
+
+    def test_refresh_matches_rebuild(self):
+        recommendations.rebuild()
+        expected = {name: self.recommended(name) for name in self.users}
+        Recommendation.objects.all().delete()
+        recommendations.refresh([user.pk for user in self.users.values()])
+        self.assertEqual({name: self.recommended(name) for name in self.users}, expected)
+
+    def test_follow_refreshes_recommendations(self):
+        recommendations.rebuild()
+        self.client.force_login(self.users['reader'])
+        self.client.get(reverse('profile_follow', args=['fof']))
+        # TestCase never commits, so run the pending on_commit callbacks by hand.
+        for _, callback in connection.run_on_commit:
+            callback()
+        self.assertNotIn('fof', dict(self.recommended('reader')))
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual([item.author.username for item in response.context['suggestions']], ['cofollowed'])
+        self.assertContains(response, reverse('follow_authors'))
+
+
+class TestPostCardCache(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        self.post = Post.objects.create(text='Исходный текст', author=self.user)
+        self.author_client = Client()
+        self.author_client.force_login(self.user)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def index(self, client):
+        bump_versions('index')
+        return client.get(reverse('index'))
+
+    def test_card_reused_until_post_changes(self):
+        self.assertContains(self.index(self.client), 'Исходный текст')
+        Post.objects.filter(pk=self.post.pk).update(text='Обновлен в обход сигналов')
+        self.assertContains(self.index(self.client), 'Исходный текст')
+        self.author_client.post(
+            reverse('post_edit', args=[self.user.username, self.post.pk]), {'text': 'Отредактированный текст'}
+        )
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, 1)
+        self.assertContains(self.index(self.client), 'Отредактированный текст')
+        self.reader_client.post(reverse('add_comment', args=[self.user.username, self.post.pk]), {'text': 'Ок'})
+        self.assertContains(self.index(self.client), '1 комментариев')
+
+    def test_card_follows_group_and_author_names(self):
+        group = Group.objects.create(title='Старая группа', slug='old')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        self.assertContains(self.index(self.client), 'Старая группа')
+        group.title, group.slug = 'Новая группа', 'new'
+        group.save()
+        self.user.username = 'Renamed_user'
+        self.user.save()
+        response = self.index(self.client)
+        self.assertContains(response, 'Новая группа')
+        self.assertContains(response, reverse('group_posts', args=['new']))
+        self.assertContains(response, '@Renamed_user')
+        self.user.first_name = 'Иван'
+        self.user.save()
+        self.assertContains(self.client.get(reverse('profile', args=['Renamed_user'])), 'Иван')
+
+    def test_edit_link_is_per_viewer(self):
+        self.assertContains(self.index(self.author_client), 'Редактировать')
+        self.assertNotContains(self.index(self.reader_client), 'Редактировать')
+        self.assertContains(self.index(self.author_client), 'Редактировать')
+
+
+class TestPageInvalidation(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Старая группа', slug='old')
+        self.post = Post.objects.create(text='Текст', author=self.user, group=self.group)
+        self.urls = [
+            reverse('index'),
+            reverse('profile', args=[self.user.username]),
+            reverse('post', args=[self.user.username, self.post.pk]),
+        ]
+        for url in self.urls:
+            self.assertContains(self.client.get(url), 'Старая группа')
+
+    def test_deleted_group(self):
+        self.group.delete()
+        for url in self.urls:
+            self.assertNotContains(self.client.get(url), 'Старая группа')
+        self.assertEqual(self.client.get(reverse('group_posts', args=['old'])).status_code, 404)
+
+    def test_renamed_group(self):
+        self.assertContains(self.client.get(reverse('group_posts', args=['old'])), 'Текст')
+        self.group.title, self.group.slug = 'Новая группа', 'new'
+        self.group.save()
+        for url in self.urls:
+            self.assertContains(self.client.get(url), 'Новая группа')
+        self.assertEqual(self.client.get(reverse('group_posts', args=['old'])).status_code, 404)
+
+    def test_renamed_user(self):
+        self.assertContains(self.client.get(reverse('group_posts', args=['old'])), '@Test_user')
+        self.user.username = 'Renamed_user'
+        self.user.save()
+        self.assertEqual(self.client.get(self.urls[1]).status_code, 404)
+        self.assertEqual(self.client.get(self.urls[2]).status_code, 404)
+        self.assertContains(self.client.get(reverse('index')), '@Renamed_user')
+        self.assertContains(self.client.get(reverse('group_posts', args=['old'])), '@Renamed_user')
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as temp_file:
+            self.post = Post.objects.create(
+                text='С картинкой', author=self.user, image=get_temporary_image(temp_file).name
+            )
+
+    def test_pages_never_resize_inline(self):
+        bump_versions('index')
+        with mock.patch('sorl.thumbnail.default.engine.get_image') as get_image:
+            response = self.client.get(reverse('index'))
+        get_image.assert_not_called()
+        self.assertContains(response, 'img/placeholder.svg')
+
+    def test_generated_thumbnail_refreshes_card(self):
+        with mock.patch.object(thumbnails.backend, 'get_thumbnail') as get_thumbnail:
+            self.assertTrue(thumbnails.generate(self.post.image.name))
+        self.assertEqual(get_thumbnail.call_count, len(thumbnails.GEOMETRIES))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, 1)
+
+    def test_new_post_schedules_thumbnails(self):
+        client = Client()
+        client.force_login(self.user)
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            client.post(reverse('new_post'), {'text': 'Без картинки'})
+            client.post(reverse('new_post'), {'text': 'Картинка', 'image': SimpleUploadedFile(
+                'small.gif',
+                b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+                b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+                b'\x02\x4c\x01\x00\x3b',
+                content_type='image/gif',
+            )})
+            # TestCase never commits, so run the pending on_commit callbacks by hand.
+            for _, callback in connection.run_on_commit:
+                callback()
+        schedule.assert_called_once_with(Post.objects.get(text='Картинка').image.name)
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class TestBoundedUploads(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.client.force_login(self.user)
+
+    def image_file(self, size, image_format='PNG', mode='RGB'):
+        image_file = BytesIO()
+        Image.new(mode, size).save(image_file, image_format)
+        image_file.seek(0)
+        image_file.name = f'image.{image_format.lower()}'
+        return image_file
+
+    def upload(self, image_file):
+        return self.client.post(reverse('new_post'), {'text': 'Картинка', 'image': image_file})
+
+    @override_settings(POSTS_UPLOAD_MAX_PIXELS=10 ** 6)
+    def test_rejects_too_many_pixels_before_decoding(self):
+        image_file = self.image_file((2000, 1000), mode='1')
+        with mock.patch('PIL.Image.Image.load') as load:
+            response = self.upload(image_file)
+        load.assert_not_called()
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POSTS_UPLOAD_MAX_BYTES=1024)
+    def test_rejects_too_many_bytes(self):
+        response = self.upload(self.image_file((300, 300), 'BMP'))
+        self.assertIn('image', response.context['form'].errors)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POSTS_IMAGE_MAX_SIDE=100)
+    def test_large_image_is_downscaled(self):
+        self.upload(self.image_file((400, 200), 'JPEG'))
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual(image.size, (100, 50))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_small_image_is_stored_as_uploaded(self):
+        self.upload(self.image_file((40, 20)))
+        with Image.open(Post.objects.get().image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+
+
+class SearchTests:
+    def setUp(self):
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+
+    def commit(self):
+        # TestCase never commits, so run the pending on_commit callbacks by hand.
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
+
+    def found(self, query, cursor=None):
+        self.commit()
+        params = {'q': query} if cursor is None else {'q': query, 'cursor': cursor}
+        return self.client.get(reverse('search'), params).context['page']
+
+    def test_finds_posts_by_text_and_comments(self):
+        commented = Post.objects.create(text='Обычный день', author=self.user)
+        Comment.objects.create(post=commented, author=self.user, text='Отличные Котики')
+        post = Post.objects.create(text='Котики и собаки', author=self.user)
+        self.assertEqual(list(self.found('котики')), [post, commented])
+        self.assertEqual(list(self.found('котики собаки')), [post])
+        self.assertEqual(list(self.found('хомяки')), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text='Старый текст', author=self.user)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(list(self.found('старый')), [])
+        self.assertEqual(list(self.found('новый')), [post])
+        post.delete()
+        self.assertEqual(list(self.found('новый')), [])
+
+    def test_comments_reindex_post_once_on_commit(self):
+        post = Post.objects.create(text='Обычный день', author=self.user)
+        with mock.patch('posts.search.update_posts', wraps=search.update_posts) as update_posts:
+            for i in range(3):
+                Comment.objects.create(post=post, author=self.user, text=f'Котики {i}')
+            update_posts.assert_not_called()
+            self.assertEqual(list(self.found('котики')), [post])
+            update_posts.assert_called_once_with([post.pk])
+            update_posts.reset_mock()
+            pk = post.pk
+            post.delete()
+            self.commit()
+        # Only the post's own delete: its comments add nothing.
+        update_posts.assert_called_once_with([pk])
+        self.assertEqual(list(self.found('котики')), [])
+
+    def test_keyset_pages(self):
+        for i in range(12):
+            Post.objects.create(text=f'Запись номер {i}' + ' запись' * (i % 3), author=self.user)
+        first = self.found('запись')
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        second = self.found('запись', first.next_cursor)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(second.has_next())
+        self.assertEqual(len({post.pk for post in [*first, *second]}), 12)
+        self.assertEqual(list(self.found('запись', second.previous_cursor)), list(first))
+
+    def test_long_query(self):
+        text = ' '.join(f'слово{i}' for i in range(70))
+        post = Post.objects.create(text=text, author=self.user)
+        self.assertEqual(list(self.found(text)), [post])
+
+    def test_rebuild_command(self):
+        post = Post.objects.create(text='Потерянный пост', author=self.user)
+        Post.objects.filter(pk=post.pk).update(text='Найденный пост')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(list(self.found('найденный')), [post])
+
+
+class TestFts5Search(SearchTests, TestCase):
+    def test_uses_fts5(self):
+        self.assertIsInstance(search.get_index(), search.Fts5Index)
+
+
+@override_settings(POSTS_SEARCH_BACKEND='postings')
+class TestPostingsSearch(SearchTests, TestCase):
+    def test_reads_only_the_page(self):
+        posts = [Post.objects.create(text='Запись' + ' запись' * (i % 2), author=self.user) for i in range(6)]
+        index = search.get_index()
+        ties = [post.pk for post in posts[1::2]] + [post.pk for post in posts[::2]]
+        rows = index.search(['запись'], None, False, 4)
+        self.assertEqual([post_id for _, post_id in rows], ties[:4])
+        rows = index.search(['запись'], rows[-1], False, 4)
+        self.assertEqual([post_id for _, post_id in rows], ties[4:])
+        rows = index.search(['запись'], rows[0], True, 2)
+        self.assertEqual([post_id for _, post_id in rows], ties[3:1:-1])
+        with mock.patch('posts.search._ln_available', False):
+            self.assertEqual([post_id for _, post_id in index.search(['запись'], None, False, 6)], ties)
+
+
+class TestTransfer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.author = User.objects.create_user(username='author', email='author@testmail.com', password='test1234')
+        self.reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='test', description='Test')
+        self.post = Post.objects.create(text='Котики на экспорт', author=self.author, group=self.group)
+        Post.objects.filter(pk=self.post.pk).update(pub_date='2019-05-01T10:00:00Z')
+        Comment.objects.create(post=self.post, author=self.reader, text='Отличные котики')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_posts', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def assert_restored(self):
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(
+            (post.text, post.author.username, post.group.slug), ('Котики на экспорт', 'author', 'test')
+        )
+        self.assertEqual(post.pub_date.year, 2019)
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        reader = User.objects.get(username='reader')
+        self.assertTrue(reader.check_password('test1234'))
+        self.assertEqual(UserStats.objects.get(user=post.author).followers, 1)
+        self.assertEqual(UserStats.objects.get(user=reader).comments, 1)
+        self.assertEqual(list(FeedEntry.objects.filter(user=reader).values_list('post', flat=True)), [post.pk])
+        self.assertEqual(list(self.client.get(reverse('search'), {'q': 'котики'}).context['page']), [post])
+
+    def test_jsonl_round_trip(self):
+        path = f'{self.directory.name}/dump.jsonl'
+        with open(path, 'w') as file:
+            file.write(self.export())
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        out = StringIO()
+        call_command('import_posts', path, '--batch-size', '1', stdout=out)
+        self.assertIn('user 2, group 1, post 1, comment 1, follow 1', out.getvalue())
+        self.assert_restored()
+
+    def test_csv_reuses_existing_users(self):
+        self.export(self.directory.name, '--format', 'csv')
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        out = StringIO()
+        call_command('import_posts', self.directory.name, '--format', 'csv', stdout=out)
+        self.assertIn('user 0, group 0, post 1, comment 1, follow 1', out.getvalue())
+        self.assert_restored()
+
+    def test_import_scores_only_imported_posts(self):
+        path = f'{self.directory.name}/dump.jsonl'
+        with open(path, 'w') as file:
+            file.write(
+                '{"model": "post", "author": "author", "text": "Новая", "pub_date": "2030-01-01T00:00:00Z"}\n'
+                f'{{"model": "comment", "post": {self.post.pk}, "author": "reader", "text": "Ещё"}}\n'
+            )
+        # What a follow added: a rebuild from posts and comments would lose it.
+        followed = ranking.event_score(ranking.WEIGHTS['follow'])
+        PostScore.objects.filter(post=self.post).update(score=followed)
+        call_command('import_posts', path, stdout=StringIO())
+        new = Post.objects.get(text='Новая')
+        self.assertEqual(new.pub_date.year, 2030)
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        self.assertEqual(PostScore.objects.get(post=new).score, ranking.event_score(1, new.pub_date))
+        self.assertGreater(PostScore.objects.get(post=self.post).score, followed)
+
+    def test_follow_count_skips_existing_follows(self):
+        path = f'{self.directory.name}/dump.jsonl'
+        with open(path, 'w') as file:
+            file.write(
+                '{"model": "follow", "user": "reader", "author": "author"}\n'
+                '{"model": "follow", "user": "author", "author": "reader"}\n'
+                '{"model": "follow", "user": "author", "author": "reader"}\n'
+            )
+        out = StringIO()
+        call_command('import_posts', path, stdout=out)
+        self.assertIn('follow 1', out.getvalue())
+        self.assertEqual(Follow.objects.count(), 2)
+        self.assertEqual(UserStats.objects.get(user=self.reader).followers, 1)
+
+    def test_unknown_reference_stops_import(self):
+        path = f'{self.directory.name}/dump.jsonl'
+        with open(path, 'w') as file:
+            file.write('{"model": "post", "author": "nobody", "text": "Текст"}\n')
+        with self.assertRaisesMessage(CommandError, 'nobody'):
+            call_command('import_posts', path, stdout=StringIO())
+
+
+@override_settings(POSTS_COMMENTS_PER_PAGE=3)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.post = Post.objects.create(text='Текст', author=self.user)
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.user, text=f'Комментарий {i}') for i in range(5)
+        ]
+
+    def test_post_page_shows_first_batch(self):
+        response = self.client.get(reverse('post', args=['Test_user', self.post.pk]))
+        self.assertEqual([comment.text for comment in response.context['items']], [
+            'Комментарий 0', 'Комментарий 1', 'Комментарий 2',
+        ])
+        self.assertContains(response, 'Комментариев: 5')
+        self.assertContains(response, 'data-more=')
+        self.assertNotContains(response, 'Комментарий 3')
+        self.assertEqual(
+            sorted(comment.text for comment in response.context['comments']),
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'],
+        )
+
+    def test_load_more_returns_next_batch(self):
+        items = self.client.get(reverse('post', args=['Test_user', self.post.pk])).context['items']
+        url = reverse('post_comments', args=['Test_user', self.post.pk])
+        response = self.client.get(url, {'cursor': items.next_cursor})
+        self.assertEqual([comment.text for comment in response.context['items']], ['Комментарий 3', 'Комментарий 4'])
+        self.assertNotContains(response, 'data-more=')
+        self.assertEqual(self.client.get(reverse('post_comments', args=['nobody', self.post.pk])).status_code, 404)
+
+    def test_comment_count_follows_comments(self):
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 5)
+        self.comments[0].delete()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 4)
+        Post.objects.filter(pk=self.post.pk).update(comment_count=0)
+        Post.objects.recount_comments()
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comment_count, 4)
+
+    def test_page_queries_do_not_grow_with_comments(self):
+        url = reverse('post', args=['Test_user', self.post.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        other = User.objects.create_user(username='other', email='other@testmail.com', password='test1234')
+        for i in range(3):
+            Comment.objects.create(post=self.post, author=other, text='Ещё')
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_comment_form_after_new_login(self):
+        # The page carries the CSRF token, which a new login rotates: it must not come from the cache.
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('post', args=['Test_user', self.post.pk])
+        client.login(username='Test_user', password='test1234')
+        client.get(url)
+        client.logout()
+        client.login(username='Test_user', password='test1234')
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', client.get(url).content.decode())[1]
+        response = client.post(
+            reverse('add_comment', args=['Test_user', self.post.pk]),
+            {'text': 'После входа', 'csrfmiddlewaretoken': token},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Comment.objects.filter(text='После входа').exists())
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.author = User.objects.create_user(username='author', email='author@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='test', description='Test')
+        self.quiet = Post.objects.create(text='Тихая запись', author=self.user)
+        self.discussed = Post.objects.create(text='Обсуждаемая запись', author=self.user, group=self.group)
+        self.client.force_login(self.user)
+
+    def popular(self, *args):
+        url = reverse('group_popular', args=args) if args else reverse('popular')
+        return [post.text for post in self.client.get(url).context['posts']]
+
+    def test_comments_and_follows_raise_posts(self):
+        self.assertEqual(self.popular(), ['Обсуждаемая запись', 'Тихая запись'])
+        for _ in range(2):
+            self.client.post(reverse('add_comment', args=['Test_user', self.quiet.pk]), {'text': 'Комментарий'})
+        self.assertEqual(self.popular(), ['Тихая запись', 'Обсуждаемая запись'])
+        self.assertEqual(self.popular('test'), ['Обсуждаемая запись'])
+
+        Post.objects.create(text='Запись автора', author=self.author)
+        self.client.get(reverse('profile_follow', args=['author']))
+        self.assertEqual(self.popular()[0], 'Запись автора')
+
+    def test_recent_events_outweigh_old_ones(self):
+        now = timezone.now()
+        old = ranking.event_score(ranking.WEIGHTS['comment'], now - timedelta(days=1))
+        new = ranking.event_score(ranking.WEIGHTS['post'], now)
+        self.assertLess(old, new)
+        # Every score shifts by the same amount over time, so the order of stored scores never changes.
+        later = now + timedelta(hours=3)
+        self.assertAlmostEqual(
+            ranking.event_score(1, later) - ranking.event_score(1, now),
+            ranking.event_score(2, later) - ranking.event_score(2, now),
+        )
+
+    def test_group_change_moves_score(self):
+        self.quiet.group = self.group
+        self.quiet.save()
+        self.assertEqual(PostScore.objects.get(post=self.quiet).group_id, self.group.pk)
+        self.assertEqual(self.popular('test'), ['Обсуждаемая запись', 'Тихая запись'])
+
+    def test_top_is_one_indexed_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            posts = ranking.top(self.group.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(posts, [self.discussed])
+
+    def test_rebuild_and_prune(self):
+        Comment.objects.create(post=self.quiet, author=self.user, text='Комментарий')
+        expected = list(PostScore.objects.order_by('-score').values_list('post_id', 'score'))
+        call_command('rank_posts', '--rebuild', stdout=StringIO())
+        rebuilt = list(PostScore.objects.order_by('-score').values_list('post_id', 'score'))
+        self.assertEqual([pk for pk, score in rebuilt], [pk for pk, score in expected])
+        for (_, score), (_, rebuilt_score) in zip(expected, rebuilt):
+            self.assertAlmostEqual(score, rebuilt_score)
+
+        week_ago = ranking.event_score(1, timezone.now() - timedelta(days=7))
+        PostScore.objects.filter(post=self.quiet).update(score=week_ago)
+        with override_settings(POSTS_TRENDING_SIZE=1):
+            self.assertEqual(ranking.prune(), 1)
+        self.assertEqual(self.popular(), ['Обсуждаемая запись'])
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='test', description='Test')
+        self.posts = [
+            Post.objects.create(text=f'Запись {i}', author=self.user, group=self.group) for i in range(12)
+        ]
+
+    def test_feeds_use_cursor_pages(self):
+        first = self.client.get(reverse('api_index')).json()
+        self.assertEqual([post['text'] for post in first['results']], [f'Запись {i}' for i in range(11, 1, -1)])
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([post['id'] for post in second['results']], [self.posts[1].pk, self.posts[0].pk])
+        self.assertIsNone(second['next'])
+
+        group = self.client.get(reverse('api_group_posts', args=['test'])).json()
+        self.assertEqual((group['title'], len(group['results'])), ('Test', 10))
+        profile = self.client.get(reverse('api_profile', args=['Test_user'])).json()
+        self.assertEqual((profile['posts'], profile['results'][0]['author']), (12, 'Test_user'))
+        self.assertEqual(self.client.get(reverse('api_profile', args=['nobody'])).status_code, 404)
+
+    def test_unchanged_feed_is_not_modified(self):
+        url = reverse('api_profile', args=['Test_user'])
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        Post.objects.create(text='Новая запись', author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Новая запись')
+
+    def test_post_detail_changes_with_comments(self):
+        post = self.posts[0]
+        url = reverse('api_post', args=['Test_user', post.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['comment_list'], [])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        Comment.objects.create(post=post, author=self.user, text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comments'], 1)
+        self.assertEqual(response.json()['comment_list'][0]['text'], 'Комментарий')
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@testmail.com', password='test1234')
+        self.reader = User.objects.create_user(username='reader', email='reader@testmail.com', password='test1234')
+        self.group = Group.objects.create(title='Test', slug='test', description='Test')
+        self.post = Post.objects.create(text='Текст', author=self.author, group=self.group)
+        Comment.objects.create(post=self.post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+
+    def plans(self, url):
+        bump_versions('index', 'group:test', 'profile:author')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                # The FTS5 table orders by rank itself; that sort is the ranking, not a missing index.
+                if query['sql'].startswith('SELECT') and search.FTS_TABLE not in query['sql']:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                    yield query['sql'], [row[3] for row in cursor.fetchall()]
+
+    def test_views_use_indexes(self):
+        urls = [
+            reverse('index'),
+            reverse('index') + '?cursor=',
+            reverse('group_posts', args=['test']),
+            reverse('group_posts', args=['test']) + '?cursor=',
+            reverse('popular'),
+            reverse('group_popular', args=['test']),
+            reverse('profile', args=['author']),
+            reverse('profile', args=['author']) + '?cursor=',
+            reverse('post', args=['author', self.post.pk]),
+            reverse('post_comments', args=['author', self.post.pk]) + '?cursor=',
+            reverse('follow_index'),
+            reverse('follow_index') + '?cursor=',
+            reverse('search') + '?q=текст',
+            reverse('api_index'),
+            reverse('api_group_posts', args=['test']),
+            reverse('api_profile', args=['author']),
+            reverse('api_post', args=['author', self.post.pk]),
+        ]
+        tables = set(connection.introspection.table_names())
+        for url in urls:
+            for sql, plan in self.plans(url):
+                for step in plan:
+                    with self.subTest(url=url, sql=sql, step=step):
+                        self.assertNotIn('TEMP B-TREE', step)
+                        words = step.split()
+                        if words[0] == 'SCAN' and words[1] in tables:
+                            self.assertIn('INDEX', step)
@@ -0,0 +1,86 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as thumbnail_defaults, settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from yatube.instrumentation import timing
+
+logger = logging.getLogger(__name__)
+
+# Every geometry the templates render, so uploads are resized once, off the request.
+GEOMETRIES = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+
+_executor = None
+
+
+class PregeneratedThumbnailBackend(ThumbnailBackend):
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """
+        Same lookup as get_thumbnail, but never decodes or resizes the source.
+        """
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(thumbnail_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = PregeneratedThumbnailBackend()
+
+
+def refresh_pages(name):
+    from .caching import bump_versions, page_scopes
+    from .models import Post
+
+    posts = Post.objects.filter(image=name)
+    rows = list(posts.values_list('author_id', 'group_id'))
+    if rows:
+        posts.update(version=F('version') + 1)
+        authors, groups = zip(*rows)
+        bump_versions('index', *page_scopes(authors, groups))
+
+
+def generate(name):
+    started = time.perf_counter()
+    try:
+        for geometry, options in GEOMETRIES:
+            backend.get_thumbnail(name, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        return False
+    finally:
+        timing.send(sender=PregeneratedThumbnailBackend, name='thumbnail', duration=time.perf_counter() - started)
+    # Cards and pages were rendered with a placeholder until now.
+    refresh_pages(name)
+    return True
+
+
+def _generate_in_worker(name):
+    try:
+        return generate(name)
+    finally:
+        connection.close()
+
+
+def schedule(name):
+    global _executor
+    if not settings.POSTS_THUMBNAIL_WORKERS:
+        return generate(name)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.POSTS_THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    return _executor.submit(_generate_in_worker, name)
@@ -0,0 +1,286 @@
+import csv
+import json
+import os
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Case, Max, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from yatube.db.base import logaddexp
+
+from . import inbox, ranking, search
+from .caching import bump_versions, page_scopes
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# In dependency order: every record refers only to models listed before it.
+MODELS = ['user', 'group', 'post', 'comment', 'follow']
+FIELDS = {
+    'user': [
+        'username', 'first_name', 'last_name', 'email', 'password', 'is_active', 'is_staff', 'is_superuser',
+        'date_joined',
+    ],
+    'group': ['slug', 'title', 'description'],
+    'post': ['id', 'author', 'group', 'text', 'pub_date', 'image'],
+    'comment': ['id', 'post', 'author', 'text', 'created'],
+    'follow': ['user', 'author'],
+}
+
+
+def export_queryset(model):
+    return {
+        'user': User.objects.values_list(*FIELDS['user']),
+        'group': Group.objects.values_list(*FIELDS['group']),
+        'post': Post.objects.values_list('id', 'author__username', 'group__slug', 'text', 'pub_date', 'image'),
+        'comment': Comment.objects.values_list('id', 'post_id', 'author__username', 'text', 'created'),
+        'follow': Follow.objects.values_list('user__username', 'author__username'),
+    }[model].order_by('pk')
+
+
+def export_rows(model, chunk_size=2000):
+    for row in export_queryset(model).iterator(chunk_size=chunk_size):
+        yield dict(zip(FIELDS[model], (value.isoformat() if hasattr(value, 'isoformat') else value for value in row)))
+
+
+def write_jsonl(file, models=MODELS, chunk_size=2000):
+    counts = Counter()
+    for model in models:
+        for row in export_rows(model, chunk_size):
+            file.write(json.dumps({'model': model, **row}, ensure_ascii=False) + '\n')
+            counts[model] += 1
+    return counts
+
+
+def write_csv(directory, models=MODELS, chunk_size=2000):
+    counts = Counter()
+    for model in models:
+        with open(os.path.join(directory, f'{model}.csv'), 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, FIELDS[model])
+            writer.writeheader()
+            for row in export_rows(model, chunk_size):
+                writer.writerow(row)
+                counts[model] += 1
+    return counts
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop('model', None), record
+
+
+def read_csv(directory):
+    for model in MODELS:
+        path = os.path.join(directory, f'{model}.csv')
+        if os.path.exists(path):
+            with open(path, newline='', encoding='utf-8') as file:
+                for record in csv.DictReader(file):
+                    yield model, record
+
+
+def assign_ids(model, batch):
+    # Rows without an id get one now, so their dates and the search index can be updated by id.
+    ids = [int(record['id']) if record.get('id') else None for record in batch]
+    next_id = max([model.objects.aggregate(last=Max('pk'))['last'] or 0, *filter(None, ids)]) + 1
+    for i, pk in enumerate(ids):
+        if pk is None:
+            ids[i], next_id = next_id, next_id + 1
+    return ids
+
+
+def parse_bool(value):
+    return value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}')
+    return date if timezone.is_aware(date) else timezone.make_aware(date)
+
+
+def chunks(values, size=500):
+    values = sorted(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def set_dates(model, field_name, dates):
+    """
+    Writes {pk: date} over the rows a bulk_create just inserted:
+    auto_now_add stamps them (and the instances) with the current time and
+    cannot be turned off for a single statement.
+    """
+    field = model._meta.get_field(field_name)
+    for pks in chunks(dates, 300):
+        model.objects.filter(pk__in=pks).update(**{field_name: Case(
+            *(When(pk=pk, then=Value(dates[pk], output_field=field)) for pk in pks), output_field=field,
+        )})
+
+
+class Importer:
+    """
+    Collects records into per-model batches and bulk-inserts each full batch
+    in its own transaction. Users and groups are matched by username and slug
+    (existing ones are reused), posts and comments keep their ids.
+    bulk_create sends no signals: each batch records its popularity scores
+    itself, and rebuild() redoes the rest for every user and group the
+    import referred to: counters, follow inboxes and cached pages. Memory
+    grows with the number of users and groups, not of imported rows.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.batches = {model: [] for model in MODELS}
+        self.counts = Counter()
+        self.users = {}
+        self.groups = {}
+
+    def add(self, model, record):
+        if model not in self.batches:
+            raise ValueError(f'Неизвестная модель: {model}')
+        self.batches[model].append(record)
+        if len(self.batches[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, last=MODELS[-1]):
+        # Earlier models first: a post may refer to a user still waiting in its batch.
+        for model in MODELS[:MODELS.index(last) + 1]:
+            batch, self.batches[model] = self.batches[model], []
+            if batch:
+                with transaction.atomic():
+                    self.counts[model] += getattr(self, f'import_{model}s')(batch)
+
+    def user_ids(self, usernames):
+        missing = set(usernames) - self.users.keys()
+        if missing:
+            self.users.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+        unknown = set(usernames) - self.users.keys()
+        if unknown:
+            raise ValueError(f'Нет пользователей: {", ".join(sorted(unknown))}')
+        return self.users
+
+    def group_ids(self, slugs):
+        missing = set(slugs) - self.groups.keys()
+        if missing:
+            self.groups.update(Group.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+        unknown = set(slugs) - self.groups.keys()
+        if unknown:
+            raise ValueError(f'Нет групп: {", ".join(sorted(unknown))}')
+        return self.groups
+
+    def import_users(self, batch):
+        records = {record['username']: record for record in batch}
+        existing = set(User.objects.filter(username__in=records).values_list('username', flat=True))
+        User.objects.bulk_create([
+            User(
+                username=username,
+                first_name=record.get('first_name') or '',
+                last_name=record.get('last_name') or '',
+                email=record.get('email') or '',
+                password=record.get('password') or make_password(None),
+                is_active=parse_bool(record.get('is_active', True)),
+                is_staff=parse_bool(record.get('is_staff', False)),
+                is_superuser=parse_bool(record.get('is_superuser', False)),
+                date_joined=parse_date(record.get('date_joined')),
+            )
+            for username, record in records.items() if username not in existing
+        ])
+        self.user_ids(records)
+        return len(records) - len(existing)
+
+    def import_groups(self, batch):
+        records = {record['slug']: record for record in batch}
+        existing = set(Group.objects.filter(slug__in=records).values_list('slug', flat=True))
+        Group.objects.bulk_create([
+            Group(slug=slug, title=record['title'], description=record.get('description') or '')
+            for slug, record in records.items() if slug not in existing
+        ])
+        self.group_ids(records)
+        return len(records) - len(existing)
+
+    def import_posts(self, batch):
+        users = self.user_ids({record['author'] for record in batch})
+        groups = self.group_ids({record['group'] for record in batch if record.get('group')})
+        posts = [
+            Post(
+                pk=pk,
+                author_id=users[record['author']],
+                group_id=groups[record['group']] if record.get('group') else None,
+                text=record['text'],
+                pub_date=parse_date(record.get('pub_date')),
+                image=record.get('image') or '',
+            )
+            for pk, record in zip(assign_ids(Post, batch), batch)
+        ]
+        dates = {post.pk: post.pub_date for post in posts}
+        Post.objects.bulk_create(posts)
+        set_dates(Post, 'pub_date', dates)
+        search.update_posts([post.pk for post in posts])
+        ranking.record_scores({pk: ranking.event_score(ranking.WEIGHTS['post'], date) for pk, date in dates.items()})
+        return len(posts)
+
+    def import_comments(self, batch):
+        users = self.user_ids({record['author'] for record in batch})
+        post_ids = {int(record['post']) for record in batch}
+        posts = {pk: (author_id, group_id) for pk, author_id, group_id in (
+            Post.objects.filter(pk__in=post_ids).values_list('pk', 'author_id', 'group_id')
+        )}
+        if post_ids - posts.keys():
+            raise ValueError(f'Нет записей: {", ".join(map(str, sorted(post_ids - posts.keys())))}')
+        comments = [
+            Comment(
+                pk=pk,
+                post_id=int(record['post']),
+                author_id=users[record['author']],
+                text=record['text'],
+                created=parse_date(record.get('created')),
+            )
+            for pk, record in zip(assign_ids(Comment, batch), batch)
+        ]
+        dates = {comment.pk: comment.created for comment in comments}
+        Comment.objects.bulk_create(comments)
+        set_dates(Comment, 'created', dates)
+        scores = {}
+        for comment in comments:
+            score = ranking.event_score(ranking.WEIGHTS['comment'], dates[comment.pk])
+            scores[comment.post_id] = logaddexp(scores[comment.post_id], score) if comment.post_id in scores else score
+        ranking.record_scores(scores)
+        Post.objects.filter(pk__in=post_ids).recount_comments()
+        search.update_posts(post_ids)
+        # Cards show comment counts, so the pages of the commented posts change too.
+        bump_versions(*page_scopes(
+            [author_id for author_id, _ in posts.values()], [group_id for _, group_id in posts.values()]
+        ))
+        return len(batch)
+
+    def import_follows(self, batch):
+        users = self.user_ids({record['user'] for record in batch} | {record['author'] for record in batch})
+        pairs = {
+            (users[record['user']], users[record['author']]) for record in batch if record['user'] != record['author']
+        }
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs}, author_id__in={author_id for _, author_id in pairs}
+        ).values_list('user_id', 'author_id'))
+        follows = [Follow(user_id=user_id, author_id=author_id) for user_id, author_id in sorted(pairs - existing)]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        return len(follows)
+
+    def rebuild(self):
+        user_ids = set(self.users.values())
+        with transaction.atomic():
+            for chunk in chunks(user_ids):
+                UserStats.objects.recount(chunk)
+            # After the counters: whether an author is pushed or pulled depends on them.
+            inbox.backfill_authors(sorted(user_ids))
+            # The batches recorded every imported post; the negligible ones go now.
+            ranking.prune()
+            bump_versions('index')
+            for chunk in chunks(user_ids):
+                bump_versions(*page_scopes(chunk))
+            for chunk in chunks(self.groups.values()):
+                bump_versions(*page_scopes(group_ids=chunk))
@@ -0,0 +1,78 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from PIL import Image
+
+# Enough for the header of every format Pillow reads; the pixel data is never decoded here.
+HEADER_BYTES = 64 * 1024
+
+
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to a temporary file and drop images over the byte or pixel budget.
+
+    The size is read from the image header as soon as it arrives, so a
+    decompression bomb is rejected before any of it is decoded. Reasons end
+    up in request.upload_errors, keyed by field name.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.header = bytearray()
+
+    def reject(self, message):
+        if not hasattr(self.request, 'upload_errors'):
+            self.request.upload_errors = {}
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.POSTS_UPLOAD_MAX_BYTES:
+            self.reject(f'Файл больше {settings.POSTS_UPLOAD_MAX_BYTES // 2 ** 20} МБ')
+        if self.header is not None:
+            self.check_header(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_header(self, data):
+        self.header += data[:HEADER_BYTES - len(self.header)]
+        try:
+            with Image.open(io.BytesIO(self.header)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width, height = Image.MAX_IMAGE_PIXELS, Image.MAX_IMAGE_PIXELS
+        except Exception:
+            # Not enough data yet, or not an image: ImageField validation will say so.
+            if len(self.header) >= HEADER_BYTES:
+                self.header = None
+            return
+        self.header = None
+        if width * height > settings.POSTS_UPLOAD_MAX_PIXELS:
+            self.reject(f'Изображение больше {settings.POSTS_UPLOAD_MAX_PIXELS // 10 ** 6} Мп')
+
+
+def bound_image(upload):
+    """
+    Downscale and re-encode an uploaded image larger than POSTS_IMAGE_MAX_SIDE.
+
+    Metadata is dropped along the way; smaller images are stored as uploaded.
+    """
+    max_side = settings.POSTS_IMAGE_MAX_SIDE
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if max(image.size) <= max_side:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        # For JPEG the decoder itself scales down, so the full size bitmap is never built.
+        image.draft(image.mode, (max_side, max_side))
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, image_format, quality=settings.POSTS_IMAGE_QUALITY, optimize=True)
+    return InMemoryUploadedFile(
+        output, 'image', os.path.basename(upload.name), upload.content_type, output.tell(), upload.charset
+    )
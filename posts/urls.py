@@ -1,13 +1,23 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
+    # Before the <str:username>/ patterns below.
+    path('api/posts/', api.index, name='api_index'),
+    path('api/posts/<str:username>/<int:post_id>/', api.post_view, name='api_post'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_posts'),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
     path('new/', views.new_post, name='new_post'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path('group/<slug:slug>/popular/', views.group_popular, name='group_popular'),
+    path('popular/', views.popular, name='popular'),
     path('', views.index, name='index'),
     path("follow/", views.follow_index, name="follow_index"),
+    path('follow/authors/', views.follow_authors, name='follow_authors'),
+    path('search/', views.search, name='search'),
     path('<str:username>/<int:post_id>/comment', views.add_comment, name='add_comment'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments, name='post_comments'),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
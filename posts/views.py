@@ -1,34 +1,54 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_POST
 
+from yatube.db.routers import use_primary
+
+from . import follows, ranking
+from .caching import versioned_cache_page
 from .forms import CommentForm, PostForm
+from .inbox import FEED_ORDERING, follow_feed
 from .models import Follow, Group, Post, User
+from .paginator import PER_PAGE, CursorPaginator, paginate
+from .search import SearchPaginator
 
 
-@cache_page(20, key_prefix='index_page')
+@versioned_cache_page('index')
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.feed()
+    paginator, page = paginate(request, post_list)
     return render(request, 'index.html', {'page': page, 'paginator': paginator})
 
 
+@versioned_cache_page('group', 'slug')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.feed()
+    paginator, page = paginate(request, posts)
     return render(request, 'group.html', {'group': group, 'page': page, 'paginator': paginator})
 
 
+@versioned_cache_page('popular')
+def popular(request):
+    return render(request, 'popular.html', {'posts': ranking.top(), 'popular': True})
+
+
+@versioned_cache_page('popular')
+def group_popular(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return render(request, 'popular.html', {'group': group, 'posts': ranking.top(group.pk), 'popular': True})
+
+
 @login_required
+@use_primary()
+@transaction.atomic
 def new_post(request):
     if request.method == 'POST':
-        form = PostForm(request.POST)
+        form = PostForm(
+            request.POST, files=request.FILES or None, upload_errors=getattr(request, 'upload_errors', None)
+        )
         if form.is_valid():
             post_new = form.save(commit=False)
             post_new.author = request.user
@@ -39,12 +59,11 @@ def new_post(request):
     return render(request, 'new_post.html', {'form': form})
 
 
+@versioned_cache_page('profile', 'username')
 def profile(request, username):
-    post_author = get_object_or_404(User, username=username)
-    post = Post.objects.filter(author=post_author)
-    paginator = Paginator(post, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    post = Post.objects.feed().filter(author=post_author)
+    paginator, page = paginate(request, post)
     following = False
     if request.user.is_authenticated:
         following = Follow.objects.filter(author=post_author, user=request.user)
@@ -58,21 +77,43 @@ def profile(request, username):
     )
 
 
+def comments_page(request, comments):
+    paginator = CursorPaginator(comments, settings.POSTS_COMMENTS_PER_PAGE, ordering=('created', 'pk'))
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+@versioned_cache_page('profile', 'username')
 def post_view(request, username, post_id):
-    post_author = User.objects.get(username=username)
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
-    items = post.comments.all()
+    post_author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    post = get_object_or_404(Post.objects.feed(), pk=post_id, author__username=username)
+    items = comments_page(request, post.comments.select_related('author'))
+    # Templates and callers that expect a QuerySet get the shown batch, never all of the post's comments.
+    comments = post.comments.filter(pk__in=[comment.pk for comment in items])
     form = CommentForm()
-    return render(
-        request, 'includes/post.html', {'post_author': post_author, 'post': post, 'form': form, 'items': items}
-    )
+    return render(request, 'includes/post.html', {
+        'post_author': post_author, 'post': post, 'form': form, 'comments': comments, 'items': items,
+    })
+
+
+@versioned_cache_page('profile', 'username')
+def post_comments(request, username, post_id):
+    post = get_object_or_404(Post.objects.select_related('author'), pk=post_id, author__username=username)
+    items = comments_page(request, post.comments.select_related('author'))
+    return render(request, 'includes/comment_list.html', {'post': post, 'items': items})
 
 
 @login_required
+@use_primary()
+@transaction.atomic
 def post_edit(request, username, post_id):
     post_author = User.objects.get(username=username)
     post = get_object_or_404(Post, pk=post_id, author__username=username)
-    form = PostForm(request.POST or None, files=request.FILES or None, instance=post)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        instance=post,
+        upload_errors=getattr(request, 'upload_errors', None),
+    )
     if form.is_valid():
         form.save()
         return redirect('post', username=post_author, post_id=post_id)
@@ -80,6 +121,8 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@use_primary()
+@transaction.atomic
 def add_comment(request, username, post_id):
     post_author = User.objects.get(username=username)
     post = get_object_or_404(Post, pk=post_id, author__username=username)
@@ -96,29 +139,47 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'follow.html', {'page': page, 'paginator': paginator})
+    post_list = follow_feed(request.user)
+    paginator, page = paginate(request, post_list, ordering=FEED_ORDERING)
+    suggestions = request.user.recommendations.select_related('author').order_by('-score')
+    return render(request, 'follow.html', {'page': page, 'paginator': paginator, 'suggestions': suggestions})
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return render(request, 'search.html', {'query': query, 'page': page, 'paginator': paginator})
 
 
 @login_required
+@use_primary()
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+    get_object_or_404(User.objects.only('pk'), username=username)
+    follows.follow(request.user, [username])
     return redirect('profile', username=username)
 
 
 @login_required
+@use_primary()
 def profile_unfollow(request, username):
-    unfollow_profile = Follow.objects.get(author__username=username, user=request.user)
-    if Follow.objects.filter(pk=unfollow_profile.pk):
-        unfollow_profile.delete()
+    follows.unfollow(request.user, [username])
     return redirect('profile', username=username)
 
 
+@login_required
+@use_primary()
+@require_POST
+def follow_authors(request):
+    # Onboarding: follow (or unfollow) every checked author at once.
+    usernames = request.POST.getlist('author')
+    if request.POST.get('action') == 'unfollow':
+        follows.unfollow(request.user, usernames)
+    else:
+        follows.follow(request.user, usernames)
+    return redirect('follow_index')
+
+
 def page_not_found(request, exception):
     return render(
         request,
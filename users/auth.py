@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_user(request):
+    """
+    django.contrib.auth.get_user with the user row read from the cache.
+    The session hash is still checked on every request against the cached
+    password hash; users.signals drops the entry whenever the user changes.
+    """
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    user = cache.get(user_key(user_id))
+    if user is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return AnonymousUser()
+        cache.set(user_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not session_hash or not constant_time_compare(session_hash, user.get_session_auth_hash()):
+        request.session.flush()
+        return AnonymousUser()
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
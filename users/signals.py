@@ -0,0 +1,15 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import user_key
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    # A password change must end the other sessions at once, not when the entry expires.
+    cache.delete(user_key(instance.pk))
@@ -1,3 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from posts.models import Post
+
+User = get_user_model()
+
+
+class TestCachedAuth(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='Test_user', email='test@testmail.com', password='test1234')
+        Post.objects.create(text='Текст', author=self.user)
+
+    def test_anonymous_cached_page_does_no_queries(self):
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Текст')
+
+    def test_authenticated_cached_page_does_no_queries(self):
+        self.client.login(username='Test_user', password='test1234')
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertIsNone(response.context)
+        self.assertEqual(self.client.get(reverse('new_post')).context['user'], self.user)
+
+    def test_profile_change_is_seen(self):
+        self.client.login(username='Test_user', password='test1234')
+        self.client.get(reverse('new_post'))
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale')
+        self.assertEqual(self.client.get(reverse('new_post')).context['user'].first_name, '')
+        self.user.first_name = 'Иван'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('new_post')).context['user'].first_name, 'Иван')
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.login(username='Test_user', password='test1234')
+        self.assertEqual(self.client.get(reverse('new_post')).status_code, 200)
+        self.user.set_password('new-password-1234')
+        self.user.save()
+        response = self.client.get(reverse('new_post'))
+        self.assertRedirects(response, f'{reverse("login")}?next={reverse("new_post")}')
+
+    def test_deleted_user_is_logged_out(self):
+        self.client.login(username='Test_user', password='test1234')
+        self.client.get(reverse('new_post'))
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('new_post')).status_code, 302)
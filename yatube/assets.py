@@ -0,0 +1,153 @@
+import gzip
+import json
+import mimetypes
+import os
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Formats that are not compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ico', '.ttf', '.otf', '.eot')
+# Preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+NOT_MODIFIED_HEADERS = ('ETag', 'Cache-Control', 'Vary')
+BLOCK_SIZE = 64 * 1024
+
+
+def compress(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    variants = {'.gz': gzip.compress(data, 9)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data)
+    for suffix, compressed in variants.items():
+        # A variant that saves next to nothing is not worth the Content-Encoding.
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic writes every file under its plain and its hashed name, and
+    next to both a gzip and, when the brotli package is installed, a brotli
+    variant for StaticFiles to serve.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in {*paths, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress(self.path(name))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected: keep the plain URL instead of failing the page.
+            return name
+
+
+class StaticFiles:
+    """
+    WSGI wrapper serving STATIC_ROOT before Django. The client gets the
+    precompressed variant its Accept-Encoding allows, hashed names are
+    cacheable forever, and the file goes out through the server's
+    wsgi.file_wrapper (sendfile), so its bytes never pass through Python.
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root or settings.STATIC_ROOT
+        self.prefix = prefix or settings.STATIC_URL
+        try:
+            with open(os.path.join(self.root, CompressedManifestStorage.manifest_name)) as file:
+                self.hashed = set(json.load(file)['paths'].values())
+        except (OSError, ValueError, KeyError):
+            self.hashed = set()
+        # Hashed files never change, so their lookups are kept.
+        self.files = {}
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or not path.startswith(self.prefix):
+            return self.application(environ, start_response)
+        variants = self.find(path[len(self.prefix):])
+        if variants is None:
+            return self.application(environ, start_response)
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        encoding = next((encoding for encoding in variants if encoding is None or encoding in accepted), None)
+        filename, headers = variants[encoding]
+        if dict(headers)['ETag'] in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified', [header for header in headers if header[0] in NOT_MODIFIED_HEADERS])
+            return []
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return environ.get('wsgi.file_wrapper', FileWrapper)(open(filename, 'rb'), BLOCK_SIZE)
+
+    def find(self, name):
+        if name in self.files:
+            return self.files[name]
+        variants = self.load(name)
+        if variants is not None and name in self.hashed:
+            self.files[name] = variants
+        return variants
+
+    def load(self, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type = f'{content_type}; charset=utf-8'
+        cache_control = IMMUTABLE if name in self.hashed else f'public, max-age={settings.STATIC_MAX_AGE}'
+        variants = {}
+        for encoding, suffix in (*ENCODINGS, (None, '')):
+            try:
+                stat = os.stat(path + suffix)
+            except OSError:
+                continue
+            headers = [
+                ('Content-Type', content_type),
+                ('Content-Length', str(stat.st_size)),
+                ('Last-Modified', http_date(stat.st_mtime)),
+                ('ETag', f'"{int(stat.st_mtime):x}-{stat.st_size:x}{f"-{encoding}" if encoding else ""}"'),
+                ('Cache-Control', cache_control),
+            ]
+            if encoding:
+                headers.append(('Content-Encoding', encoding))
+            variants[encoding] = (path + suffix, headers)
+        if len(variants) > 1:
+            for _, headers in variants.values():
+                headers.append(('Vary', 'Accept-Encoding'))
+        return variants
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        encoding, _, params = part.partition(';')
+        if params.strip().replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(encoding.strip().lower())
+    if '*' in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
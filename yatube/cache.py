@@ -0,0 +1,341 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from .instrumentation import cache_lookup
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)',
+    'CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)',
+    'CREATE TABLE IF NOT EXISTS cache_log (stamp INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a SQLite file shared by all worker processes on the host.
+
+    Every write and delete is appended to cache_log; its stamp is the
+    version that two-tier caches compare against to drop stale L1 entries.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._log_size = int(options.get('LOG_SIZE', 10000))
+        self._local = threading.local()
+        self._writes = 0
+        self.last_stamp = None
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _write(self, callback):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = callback(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._cull()
+        return result
+
+    def _store(self, connection, key, value, expires):
+        connection.execute(
+            'REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires),
+        )
+        self.last_stamp = connection.execute('INSERT INTO cache_log (key) VALUES (?)', (key,)).lastrowid
+
+    def get_many_with_expiry(self, keys, version=None, raw=False):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        rows = self._connection().execute(
+            'SELECT key, value, expires FROM cache_entries WHERE key IN (%s)' % ', '.join('?' * len(made)),
+            list(made),
+        ).fetchall()
+        now = time.time()
+        return {
+            made[key]: (value if raw else pickle.loads(value), expires)
+            for key, value, expires in rows
+            if expires is None or expires > now
+        }
+
+    def get(self, key, default=None, version=None):
+        found = self.get_many_with_expiry([key], version=version)
+        return found[key][0] if key in found else default
+
+    def get_many(self, keys, version=None):
+        return {key: value for key, (value, _) in self.get_many_with_expiry(keys, version=version).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(lambda connection: self._store(connection, key, value, self.get_backend_timeout(timeout)))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def add(connection):
+            row = connection.execute('SELECT expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and (row[0] is None or row[0] > time.time()):
+                return False
+            self._store(connection, key, value, self.get_backend_timeout(timeout))
+            return True
+        return self._write(add)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def incr(connection):
+            row = connection.execute('SELECT value, expires FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            self._store(connection, key, value, row[1])
+            return value
+        return self._write(incr)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._write(lambda connection: connection.execute(
+            'UPDATE cache_entries SET expires = ? WHERE key = ?', (self.get_backend_timeout(timeout), key)
+        ).rowcount))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        def delete(connection):
+            connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+            connection.execute('INSERT INTO cache_log (key) VALUES (?)', (key,))
+        self._write(delete)
+
+    def has_key(self, key, version=None):
+        return key in self.get_many_with_expiry([key], version=version)
+
+    def clear(self):
+        def clear(connection):
+            connection.execute('DELETE FROM cache_entries')
+            connection.execute('INSERT INTO cache_log (key) VALUES (NULL)')
+        self._write(clear)
+
+    def changes_since(self, stamp):
+        """
+        Return (current stamp, [(stamp, key), ...] written after `stamp`).
+        The list is None when the log no longer reaches back that far or
+        the cache was cleared.
+        """
+        connection = self._connection()
+        first, last = connection.execute('SELECT MIN(stamp), MAX(stamp) FROM cache_log').fetchone()
+        last = last or 0
+        if stamp is None or stamp > last or (first is not None and first > stamp + 1):
+            return last, None
+        if stamp == last:
+            return last, []
+        changes = connection.execute('SELECT stamp, key FROM cache_log WHERE stamp > ?', (stamp,)).fetchall()
+        return last, None if any(key is None for _, key in changes) else changes
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM cache_entries WHERE expires <= ?', (time.time(),))
+            count = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+            if count > self._max_entries:
+                connection.execute(
+                    'DELETE FROM cache_entries WHERE key IN '
+                    '(SELECT key FROM cache_entries ORDER BY expires IS NULL, expires LIMIT ?)',
+                    (count // self._cull_frequency,),
+                )
+                connection.execute('INSERT INTO cache_log (key) VALUES (NULL)')
+            connection.execute(
+                'DELETE FROM cache_log WHERE stamp <= (SELECT MAX(stamp) FROM cache_log) - ?', (self._log_size,)
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+# L1 stores are per process, shared by the per-thread backend instances.
+_l1_stores = {}
+_l1_lock = threading.Lock()
+
+
+class _L1Store:
+    def __init__(self, max_entries):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.synced = 0.0
+        self.stats = Counter()
+
+
+class TwoTierCache(BaseCache):
+    """
+    Small in-process LRU (L1) in front of a shared cache (L2).
+
+    Writes go through both tiers; L1 keeps pickled values, so callers never
+    share mutable objects such as cached responses. With an L2 that keeps a change log
+    (SQLiteCache) L1 drops entries written by other processes at most
+    SYNC_INTERVAL seconds after the change; with any other L2 backend L1
+    entries simply live for L1_TIMEOUT seconds.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        l2_class = import_string(options.pop('L2_BACKEND', 'yatube.cache.SQLiteCache'))
+        l1_max_entries = int(options.pop('L1_MAX_ENTRIES', 1000))
+        self._sync_interval = float(options.pop('SYNC_INTERVAL', 0.1))
+        self._l1_timeout = float(options.pop('L1_TIMEOUT', 5))
+        self._l2 = l2_class(location, {**params, 'OPTIONS': options})
+        self._versioned = hasattr(self._l2, 'changes_since')
+        with _l1_lock:
+            self._l1 = _l1_stores.setdefault(f'{location}:{l2_class.__name__}', _L1Store(l1_max_entries))
+            if self._versioned and self._l1.stamp is None:
+                self._l1.stamp = self._l2.changes_since(None)[0]
+
+    @property
+    def stats(self):
+        return dict(self._l1.stats)
+
+    def _sync(self):
+        l1 = self._l1
+        now = time.monotonic()
+        if not self._versioned or now - l1.synced < self._sync_interval:
+            return
+        stamp, changes = self._l2.changes_since(l1.stamp)
+        with l1.lock:
+            if changes is None:
+                l1.entries.clear()
+            else:
+                for changed, key in changes:
+                    entry = l1.entries.get(key)
+                    if entry is not None and entry[2] < changed:
+                        del l1.entries[key]
+            l1.stamp = stamp
+            l1.synced = now
+
+    def _l1_expires(self, expires):
+        if self._versioned:
+            return expires
+        limit = time.time() + self._l1_timeout
+        return limit if expires is None else min(expires, limit)
+
+    def _l1_set(self, key, value, expires, stamp=None):
+        l1 = self._l1
+        with l1.lock:
+            l1.entries[key] = (value, self._l1_expires(expires), stamp or l1.stamp or 0)
+            l1.entries.move_to_end(key)
+            while len(l1.entries) > l1.max_entries:
+                l1.entries.popitem(last=False)
+
+    def _l1_delete(self, key):
+        with self._l1.lock:
+            self._l1.entries.pop(key, None)
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        l1 = self._l1
+        made = {self._l2.make_key(key, version=version): key for key in keys}
+        found = {}
+        now = time.time()
+        with l1.lock:
+            for made_key, key in made.items():
+                entry = l1.entries.get(made_key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    l1.entries.move_to_end(made_key)
+                    found[key] = entry[0]
+        found = {key: pickle.loads(value) for key, value in found.items()}
+        with l1.lock:
+            l1.stats['l1_hits'] += len(found)
+            l1.stats['l1_misses'] += len(made) - len(found)
+        missing = [key for key in made.values() if key not in found]
+        if not missing:
+            cache_lookup.send(sender=self.__class__, hits=len(found), misses=0)
+            return found
+        if hasattr(self._l2, 'get_many_with_expiry'):
+            rows = self._l2.get_many_with_expiry(missing, version=version, raw=True)
+        else:
+            rows = {
+                key: (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), None)
+                for key, value in self._l2.get_many(missing, version=version).items()
+            }
+        with l1.lock:
+            l1.stats['l2_hits'] += len(rows)
+            l1.stats['l2_misses'] += len(missing) - len(rows)
+        for key, (value, expires) in rows.items():
+            self._l1_set(self._l2.make_key(key, version=version), value, expires)
+            found[key] = pickle.loads(value)
+        cache_lookup.send(sender=self.__class__, hits=len(found), misses=len(missing) - len(rows))
+        return found
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._l1_set(
+            self._l2.make_key(key, version=version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            self.get_backend_timeout(timeout),
+            getattr(self._l2, 'last_stamp', None),
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self._l2.make_key(key, version=version))
+        return self._l2.add(key, value, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_delete(self._l2.make_key(key, version=version))
+        return self._l2.incr(key, delta, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(self._l2.make_key(key, version=version))
+        return self._l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self._l2.make_key(key, version=version))
+        self._l2.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return key in self.get_many([key], version=version)
+
+    def clear(self):
+        with self._l1.lock:
+            self._l1.entries.clear()
+        self._l2.clear()
+
+    def close(self, **kwargs):
+        self._l2.close(**kwargs)
@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+
+from django.db.backends.sqlite3 import base
+
+# Applied in this order on every new connection; OPTIONS['pragmas'] overrides single values.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 2 ** 20,
+    'temp_store': 'MEMORY',
+}
+# Not passed to sqlite3.connect().
+BACKEND_OPTIONS = ('pragmas', 'transaction_mode', 'maintenance_interval')
+
+
+def logaddexp(a, b):
+    # log(exp(a) + exp(b)) without overflow; NULL stands for log(0).
+    if a is None or b is None:
+        return b if a is None else a
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+# SQL functions registered on every connection: name -> (number of arguments, function).
+FUNCTIONS = {
+    'logaddexp': (2, logaddexp),
+    # SQLite has its own ln() only when built with SQLITE_ENABLE_MATH_FUNCTIONS.
+    'log1p': (1, math.log1p),
+}
+
+_maintenance_lock = threading.Lock()
+_last_maintenance = {}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend tuned for a web server with concurrent readers and writers.
+
+    OPTIONS may also hold:
+      pragmas: dict of PRAGMA values applied on connect, merged over DEFAULT_PRAGMAS;
+      transaction_mode: 'IMMEDIATE' makes atomic blocks take the write lock up
+        front, so two of them cannot deadlock upgrading a read lock, a case
+        where SQLite returns "database is locked" without waiting busy_timeout;
+      maintenance_interval: seconds between wal_checkpoint(PASSIVE) and
+        PRAGMA optimize runs, done between requests; 0 disables them.
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for name in BACKEND_OPTIONS:
+            kwargs.pop(name, None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        for name, (arity, function) in FUNCTIONS.items():
+            conn.create_function(name, arity, function, deterministic=True)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', '')
+        self.cursor().execute(f'BEGIN {mode}'.strip())
+
+    def close_if_unusable_or_obsolete(self):
+        # Called on request start and finish, outside any transaction.
+        if self.connection is not None and not self.in_atomic_block:
+            self.maybe_run_maintenance()
+        super().close_if_unusable_or_obsolete()
+
+    def maybe_run_maintenance(self):
+        interval = self.settings_dict['OPTIONS'].get('maintenance_interval', 300)
+        if not interval or self.is_in_memory_db():
+            return
+        now = time.monotonic()
+        with _maintenance_lock:
+            if now - _last_maintenance.get(self.alias, now - interval) < interval:
+                return
+            _last_maintenance[self.alias] = now
+        self.run_maintenance()
+
+    def run_maintenance(self):
+        with self.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            cursor.execute('PRAGMA optimize')
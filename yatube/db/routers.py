@@ -0,0 +1,82 @@
+import random
+import threading
+import time
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_state = threading.local()
+
+
+def reads_from_replica():
+    return bool(settings.DATABASE_REPLICAS) and not getattr(_state, 'pinned', False)
+
+
+class use_primary(ContextDecorator):
+    """
+    Send reads to the primary inside the block, e.g. in views that write.
+    """
+
+    def __enter__(self):
+        self.previous = getattr(_state, 'pinned', False)
+        _state.pinned = True
+
+    def __exit__(self, *exc_info):
+        _state.pinned = self.previous
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary, reads to a random alias from DATABASE_REPLICAS.
+
+    After the first write in a thread its reads stay on the primary, and so
+    do reads inside a transaction on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not reads_from_replica() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema with the data, from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Read-your-writes: after a request that wrote, the same client reads from
+    the primary for DATABASE_REPLICA_STICKY_SECONDS, long enough for the
+    replicas to catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        _state.pinned = request.method not in SAFE_METHODS or until > time.time()
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _state.wrote or request.method not in SAFE_METHODS
+        finally:
+            _state.pinned = _state.wrote = False
+        if wrote and settings.DATABASE_REPLICAS:
+            window = settings.DATABASE_REPLICA_STICKY_SECONDS
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + window:.3f}', max_age=window, httponly=True)
+        return response
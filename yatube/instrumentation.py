@@ -0,0 +1,185 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.dispatch import Signal
+from django.http import JsonResponse
+from django.template.base import Template
+
+logger = logging.getLogger('yatube.perf')
+
+# Code outside the request cycle (thumbnails, cache backends) reports through these.
+timing = Signal(providing_args=['name', 'duration'])
+cache_lookup = Signal(providing_args=['hits', 'misses'])
+
+_local = threading.local()
+_samples = defaultdict(lambda: deque(maxlen=settings.PERF_WINDOW))
+_samples_lock = threading.Lock()
+_original_render = None
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timings = Counter()
+
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def server_timing(self, total):
+        metrics = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.queries} queries, {self.duplicate_queries} duplicate"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ]
+        metrics += [f'{name};dur={duration * 1000:.1f}' for name, duration in self.timings.items()]
+        return ', '.join(metrics)
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+def observe(name, duration, db_time=0.0, queries=0):
+    with _samples_lock:
+        _samples[name].append((duration, db_time, queries))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary():
+    with _samples_lock:
+        samples = {name: list(values) for name, values in _samples.items()}
+    report = {}
+    for name, values in sorted(samples.items()):
+        durations = sorted(value[0] * 1000 for value in values)
+        db_times = sorted(value[1] * 1000 for value in values)
+        report[name] = {
+            'count': len(values),
+            **{f'p{q}_ms': round(percentile(durations, q / 100), 2) for q in (50, 95, 99)},
+            'db_p95_ms': round(percentile(db_times, 0.95), 2),
+            'queries_max': max(value[2] for value in values),
+        }
+    return report
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+        stats.statements[sql, repr(params)] += 1
+
+
+def record_timing(sender, name, duration, **kwargs):
+    stats = current()
+    if stats is not None:
+        stats.timings[name] += duration
+    else:
+        observe(name, duration)
+
+
+def record_cache_lookup(sender, hits, misses, **kwargs):
+    stats = current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def timed_render(self, context):
+    # Only the outermost template: includes are already inside its time.
+    stats = current()
+    if stats is None or stats.rendering:
+        return _original_render(self, context)
+    stats.rendering = True
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        stats.rendering = False
+        stats.template_time += time.perf_counter() - started
+
+
+def install():
+    global _original_render
+    if Template._render is not timed_render:
+        _original_render = Template._render
+        Template._render = timed_render
+    timing.connect(record_timing, dispatch_uid='yatube.perf.timing')
+    cache_lookup.connect(record_cache_lookup, dispatch_uid='yatube.perf.cache')
+
+
+class InstrumentationMiddleware:
+    """
+    Per-request wall, SQL, template and cache timings.
+
+    Reported in a Server-Timing header, a JSON line on the yatube.perf logger
+    and a rolling per-view summary (see summary_view). With
+    PERF_INSTRUMENTATION off the middleware is dropped at startup and nothing
+    is hooked in.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestStats()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        total = time.perf_counter() - stats.started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        observe(view, total, stats.query_time, stats.queries)
+        response['Server-Timing'] = stats.server_timing(total)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 2),
+                'queries': stats.queries,
+                'db_ms': round(stats.query_time * 1000, 2),
+                'duplicate_queries': stats.duplicate_queries,
+                'template_ms': round(stats.template_time * 1000, 2),
+                'cache_hits': stats.cache_hits,
+                'cache_misses': stats.cache_misses,
+                **{f'{name}_ms': round(duration * 1000, 2) for name, duration in stats.timings.items()},
+            }, ensure_ascii=False))
+        return response
+
+
+@staff_member_required
+def summary_view(request):
+    return JsonResponse(summary(), json_dumps_params={'ensure_ascii': False})
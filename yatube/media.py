@@ -0,0 +1,105 @@
+import mimetypes
+import os
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """
+    (first, last) byte of a single Range, None to send the whole file (no,
+    several or malformed ranges), False when the range is past the end.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            return (max(0, size - suffix), size - 1) if suffix > 0 and size else False
+        first, last = int(first), int(last) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        return False
+    return (first, min(last, size - 1)) if first <= last else None
+
+
+def read_range(file, first, last):
+    with file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            block = file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+@require_safe
+def serve(request, path):
+    """
+    MEDIA_ROOT files with ETag and Last-Modified validation and single byte
+    ranges. Whole files go through the server's wsgi.file_wrapper
+    (sendfile); with MEDIA_ACCEL_REDIRECT or MEDIA_SENDFILE the front
+    server sends the file, ranges included, and Python only checks it.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404
+    size, mtime = stat_result.st_size, int(stat_result.st_mtime)
+    etag = f'"{mtime:x}-{size:x}"'
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        if settings.MEDIA_ACCEL_REDIRECT or settings.MEDIA_SENDFILE:
+            response = HttpResponse(content_type=content_type)
+            if settings.MEDIA_ACCEL_REDIRECT:
+                response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + quote(path)
+            else:
+                response['X-Sendfile'] = full_path
+        else:
+            byte_range = None
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if 'HTTP_RANGE' in request.META and (if_range is None or if_range in (etag, http_date(mtime))):
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            if byte_range is False:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+            if byte_range:
+                first, last = byte_range
+                response = StreamingHttpResponse(
+                    read_range(open(full_path, 'rb'), first, last), status=206, content_type=content_type,
+                )
+                response['Content-Range'] = f'bytes {first}-{last}/{size}'
+                response['Content-Length'] = last - first + 1
+            else:
+                response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+                response['Content-Length'] = size
+            response['Accept-Ranges'] = 'bytes'
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
@@ -0,0 +1,91 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.handlers.wsgi import get_path_info
+from django.http.cookie import parse_cookie
+from django.urls import Resolver404, resolve
+from django.utils.cache import cc_delim_re
+
+from posts.caching import get_versions
+
+from .db.routers import STICKY_COOKIE
+
+
+def page_key(environ):
+    url = f'{environ.get("HTTP_HOST", "")}{environ.get("PATH_INFO", "")}?{environ.get("QUERY_STRING", "")}'
+    return f'wsgi:page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+@functools.lru_cache(maxsize=4096)
+def is_cached_path(path):
+    # Media, the API and other views are never stored, so they skip the cache lookup. Resolving costs about
+    # as much as a miss, hence the memo: busy paths are resolved once.
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return False
+    return hasattr(match.func, 'page_cache_scope')
+
+
+class AnonymousPageCache:
+    """
+    WSGI wrapper serving anonymous GET and HEAD requests for pages of
+    posts.caching.versioned_cache_page straight from the cache, before any
+    middleware or URL resolution. A page is stored after Django has rendered
+    it for an anonymous client, together with the scope versions it was
+    rendered at, and is served while those versions hold.
+
+    Only pages that set no cookie and used no CSRF token are stored, and
+    clients with a session, messages or replica stickiness cookie always
+    get the page from Django. So do URLs of other views, without a cache
+    lookup.
+    """
+
+    personal_cookies = (settings.SESSION_COOKIE_NAME, CookieStorage.cookie_name, STICKY_COOKIE)
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        if not self.is_anonymous_read(environ) or not self.is_cached_view(environ):
+            return self.application(environ, start_response)
+        started = time.perf_counter()
+        key = page_key(environ)
+        entry = cache.get(key)
+        if entry is not None:
+            scopes, versions, status, headers, body = entry
+            if get_versions(scopes) == versions:
+                duration = (time.perf_counter() - started) * 1000
+                start_response(status, [*headers, ('Server-Timing', f'page-cache;dur={duration:.3f}')])
+                return [] if environ['REQUEST_METHOD'] == 'HEAD' else [body]
+        response = self.application(environ, start_response)
+        self.store(key, environ, response)
+        return response
+
+    def is_anonymous_read(self, environ):
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return False
+        cookies = parse_cookie(environ.get('HTTP_COOKIE', ''))
+        return not any(name in cookies for name in self.personal_cookies)
+
+    def is_cached_view(self, environ):
+        return is_cached_path(get_path_info(environ))
+
+    def store(self, key, environ, response):
+        page = getattr(response, 'page_cache', None)
+        if page is None or response.status_code != 200 or response.streaming or response.cookies:
+            return
+        # Django's request.META is this environ.
+        if environ.get('CSRF_COOKIE_USED'):
+            return
+        vary = {header.lower() for header in cc_delim_re.split(response.get('Vary', '')) if header}
+        if vary - {'cookie'} or 'private' in response.get('Cache-Control', ''):
+            return
+        scopes, versions, timeout = page
+        headers = [(name, value) for name, value in response.items() if name.lower() != 'server-timing']
+        status = f'{response.status_code} {response.reason_phrase}'
+        cache.set(key, (scopes, versions, status, headers, response.content), timeout)
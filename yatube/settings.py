@@ -26,11 +26,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'yatube.db.routers.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,14 +57,49 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+# Anonymous pages served from the cache before Django, see yatube/pagecache.py.
+ANONYMOUS_PAGE_CACHE = True
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'maintenance_interval': 300,
+        },
     }
 }
 
+# Read replicas are copies of the primary file, kept up to date by `manage.py replicate`.
+DATABASE_REPLICAS = [f'replica{i}' for i in range(1, int(os.environ.get('YATUBE_DB_REPLICAS', 0)) + 1)]
+for alias in DATABASE_REPLICAS:
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, f'db.{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['yatube.db.routers.ReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = 5
+
+PERF_INSTRUMENTATION = os.environ.get('YATUBE_PERF_INSTRUMENTATION', '1') == '1'
+PERF_WINDOW = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'perf': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'loggers': {
+        # One JSON line per request.
+        'yatube.perf': {'handlers': ['perf'], 'level': 'WARNING' if DEBUG else 'INFO', 'propagate': False},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -87,10 +124,25 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+# collectstatic output: hashed names plus gzip/brotli variants, served by yatube.assets.StaticFiles without DEBUG.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'yatube.assets.CompressedManifestStorage'
+# For files requested by their plain name; hashed names are cached for a year.
+STATIC_MAX_AGE = 60 * 60
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads and thumbnails never change under the same name.
+MEDIA_MAX_AGE = 7 * 24 * 60 * 60
+# yatube.media.serve can leave sending the file to the front server: the prefix of an nginx `internal`
+# location aliased to MEDIA_ROOT for X-Accel-Redirect, or MEDIA_SENDFILE for X-Sendfile (Apache, lighttpd).
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_SENDFILE = False
+
+# Sessions and users are read from the cache; sessions are written through to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
 
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = 'index'
@@ -100,8 +152,36 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 SITE_ID = 1
 
+POSTS_CURSOR_PAGINATION = False
+POSTS_FANOUT_FOLLOWER_LIMIT = 1000
+POSTS_INBOX_BACKFILL = 200
+POSTS_COMMENTS_PER_PAGE = 50
+POSTS_RECOMMENDATIONS = 10
+POSTS_RECOMMENDATION_SAMPLE = 50
+POSTS_RECOMMENDATION_WORKERS = 1
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60
+POSTS_PAGE_CACHE_LOCK_TIMEOUT = 10
+POSTS_THUMBNAIL_WORKERS = 2
+POSTS_UPLOAD_MAX_BYTES = 10 * 2 ** 20
+POSTS_UPLOAD_MAX_PIXELS = 40 * 10 ** 6
+POSTS_IMAGE_MAX_SIDE = 1920
+POSTS_IMAGE_QUALITY = 85
+POSTS_SEARCH_BACKEND = 'auto'
+POSTS_TRENDING_HALF_LIFE = 6 * 60 * 60
+POSTS_TRENDING_SIZE = 20
+
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedImageUploadHandler']
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.TwoTierCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 0.1,
+        },
     }
-}
\ No newline at end of file
+}
+# manage.py test runs with the caches of yatube.test_settings (pytest uses that module directly).
+TEST_RUNNER = 'yatube.test_runner.TestRunner'
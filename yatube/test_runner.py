@@ -0,0 +1,20 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from . import test_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    manage.py test with the test-only settings of yatube.test_settings,
+    which pytest loads as its settings module.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(CACHES=test_settings.CACHES)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,12 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# The suites clear the cache, so they get a throwaway file instead of the dev server's.
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='yatube-cache-')
+atexit.register(shutil.rmtree, TEST_CACHE_DIR, ignore_errors=True)
+CACHES = {'default': {**CACHES['default'], 'LOCATION': os.path.join(TEST_CACHE_DIR, 'cache.sqlite3')}}
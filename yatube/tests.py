@@ -0,0 +1,436 @@
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from . import instrumentation
+from .assets import StaticFiles
+from .cache import SQLiteCache, TwoTierCache
+from .media import parse_range
+from .db import routers
+from .pagecache import AnonymousPageCache
+
+User = get_user_model()
+
+
+class TestTwoTierCache(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_cache(self, **options):
+        return TwoTierCache(self.location, {'OPTIONS': {'SYNC_INTERVAL': 0, **options}})
+
+    def test_suite_has_own_cache_file(self):
+        self.assertNotEqual(
+            settings.CACHES['default']['LOCATION'], os.path.join(settings.BASE_DIR, 'cache', 'cache.sqlite3')
+        )
+
+    def test_l1_serves_repeated_reads(self):
+        cache = self.make_cache()
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(cache.stats['l1_hits'], 2)
+        self.assertEqual(cache.stats.get('l2_hits', 0), 0)
+
+    def test_other_process_write_invalidates_l1(self):
+        cache = self.make_cache()
+        cache.set('key', 'old')
+        self.assertEqual(cache.get('key'), 'old')
+        SQLiteCache(self.location, {}).set('key', 'new')
+        self.assertEqual(cache.get('key'), 'new')
+        SQLiteCache(self.location, {}).delete('key')
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats['l2_misses'], 1)
+
+    def test_add_and_incr_are_shared(self):
+        cache = self.make_cache()
+        other = SQLiteCache(self.location, {})
+        self.assertTrue(cache.add('lock', 1, 10))
+        self.assertFalse(other.add('lock', 1, 10))
+        cache.set('counter', 1)
+        self.assertEqual(other.incr('counter'), 2)
+        self.assertEqual(cache.incr('counter'), 3)
+        self.assertEqual(cache.get('counter'), 3)
+
+    def test_expired_entries_are_misses(self):
+        cache = self.make_cache()
+        cache.set('key', 'value', -1)
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key', 'value', 10))
+
+    def test_l1_is_bounded(self):
+        cache = self.make_cache(L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 'a', 'b': 'b', 'c': 'c'})
+        self.assertEqual(cache.stats['l2_hits'], 1)
+
+
+class TestSQLiteBackend(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.directory.name, 'db.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def connect(self, **options):
+        connection = ConnectionHandler({'default': {'ENGINE': 'yatube.db', 'NAME': self.name, 'OPTIONS': options}})
+        connection = connection['default']
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        connection = self.connect(pragmas={'cache_size': -1000})
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(connection, 'temp_store'), 2)
+        self.assertEqual(self.pragma(connection, 'cache_size'), -1000)
+
+    def test_immediate_transactions_take_write_lock(self):
+        connection = self.connect(transaction_mode='IMMEDIATE')
+        other = sqlite3.connect(self.name, timeout=0)
+        self.addCleanup(other.close)
+        connection.ensure_connection()
+        connection._start_transaction_under_autocommit()
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        connection.cursor().execute('ROLLBACK')
+        other.execute('BEGIN IMMEDIATE')
+
+    def test_maintenance_runs_once_per_interval(self):
+        connection = self.connect(maintenance_interval=60)
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'run_maintenance') as run_maintenance:
+            with mock.patch('yatube.db.base._last_maintenance', {}):
+                connection.close_if_unusable_or_obsolete()
+                connection.ensure_connection()
+                connection.close_if_unusable_or_obsolete()
+        run_maintenance.assert_called_once_with()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_STICKY_SECONDS=5)
+class TestReplicaRouter(SimpleTestCase):
+    def setUp(self):
+        routers._state.__dict__.clear()
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def request(self, request, write=False):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(None))
+            if write:
+                self.router.db_for_write(None)
+                seen.append(self.router.db_for_read(None))
+            return HttpResponse()
+
+        response = routers.ReplicaStickinessMiddleware(view)(request)
+        return response, seen
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.router.db_for_read(None), 'replica')
+        with routers.use_primary():
+            self.assertEqual(self.router.db_for_read(None), 'default')
+        self.assertEqual(self.router.db_for_read(None), 'replica')
+        self.assertEqual(self.router.db_for_write(None), 'default')
+        self.assertEqual(self.router.db_for_read(None), 'default')
+
+    def test_client_sticks_to_primary_after_write(self):
+        response, seen = self.request(self.factory.get('/'))
+        self.assertEqual(seen, ['replica'])
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+        response, seen = self.request(self.factory.get('/follow/'), write=True)
+        self.assertEqual(seen, ['replica', 'default'])
+        cookie = response.cookies[routers.STICKY_COOKIE].value
+
+        self.factory.cookies[routers.STICKY_COOKIE] = cookie
+        self.assertEqual(self.request(self.factory.get('/'))[1], ['default'])
+        with mock.patch('time.time', return_value=float(cookie) + 1):
+            self.assertEqual(self.request(self.factory.get('/'))[1], ['replica'])
+
+    def test_unsafe_methods_read_primary(self):
+        response, seen = self.request(self.factory.post('/new/'))
+        self.assertEqual(seen, ['default'])
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(None), 'replica')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation._samples.clear()
+
+    def test_server_timing_and_summary(self):
+        with self.assertLogs('yatube.perf', 'INFO') as logs:
+            response = self.client.get(reverse('index'))
+        self.assertRegex(response['Server-Timing'], r'total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries')
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'index')
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+
+        self.assertEqual(self.client.get(reverse('perf_summary')).status_code, 302)
+        staff = User.objects.create_user(username='staff', password='test1234', is_staff=True)
+        self.client.force_login(staff)
+        summary = self.client.get(reverse('perf_summary')).json()
+        self.assertEqual(summary['index']['count'], 1)
+        self.assertLessEqual(summary['index']['p50_ms'], summary['index']['p99_ms'])
+
+    def test_duplicate_queries(self):
+        stats = instrumentation.RequestStats()
+        for params in ([1], [1], [2]):
+            stats.statements['SELECT %s', repr(params)] += 1
+        self.assertEqual(stats.duplicate_queries, 1)
+
+    @override_settings(PERF_INSTRUMENTATION=False)
+    def test_disabled_middleware_is_dropped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            instrumentation.InstrumentationMiddleware(lambda request: HttpResponse())
+        self.assertNotIn('Server-Timing', self.client.get(reverse('index')))
+
+
+class TestAnonymousPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Like the test client: closing connections at the end of a request would end the test transaction.
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        self.author = User.objects.create_user(username='author', password='test1234')
+        Post.objects.create(text='Запись', author=self.author)
+        self.calls = 0
+        handler = WSGIHandler()
+
+        def application(environ, start_response):
+            self.calls += 1
+            return handler(environ, start_response)
+        self.application = AnonymousPageCache(application)
+
+    def request(self, path, method='GET', **extra):
+        environ = getattr(RequestFactory(), method.lower())(path, **extra).environ
+        started = {}
+
+        def start_response(status, headers):
+            started.update(status=status, headers=dict(headers))
+        body = b''.join(self.application(environ, start_response))
+        return started['status'], started['headers'], body
+
+    def test_second_request_skips_django(self):
+        status, headers, body = self.request('/')
+        self.assertEqual(status, '200 OK')
+        self.assertNotIn('page-cache', headers.get('Server-Timing', ''))
+        with self.assertNumQueries(0):
+            status, cached_headers, cached_body = self.request('/')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cached_body, body)
+        self.assertRegex(cached_headers['Server-Timing'], r'^page-cache;dur=[\d.]+$')
+        self.assertEqual(self.request('/', method='HEAD')[2], b'')
+        self.assertEqual(self.calls, 1)
+
+    def test_version_bump_is_a_miss(self):
+        self.request(f'/{self.author.username}/')
+        Post.objects.create(text='Новая запись', author=self.author)
+        for _, callback in connection.run_on_commit:
+            callback()
+        status, headers, body = self.request(f'/{self.author.username}/')
+        self.assertEqual(self.calls, 2)
+        self.assertIn('Новая запись', body.decode())
+
+    def test_personal_requests_pass_through(self):
+        self.request('/')
+        self.request('/', HTTP_COOKIE='sessionid=abc')
+        self.request('/', method='POST')
+        self.assertEqual(self.calls, 3)
+
+    def test_other_views_skip_the_lookup(self):
+        with mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            for path in ('/media/posts/missing.jpg', '/api/posts/', '/no/such/page/here/'):
+                self.request(path)
+            get.assert_not_called()
+            self.request('/')
+            get.assert_called()
+        self.assertEqual(self.calls, 4)
+
+    def test_personal_responses_are_not_stored(self):
+        environ = RequestFactory().get('/').environ
+        for change in ({'CSRF_COOKIE_USED': True}, {'cookie': 'csrftoken'}, {'Vary': 'Accept-Language'}):
+            response = HttpResponse('page')
+            response.page_cache = (['index'], (1,), 60)
+            if 'cookie' in change:
+                response.set_cookie(change['cookie'], 'x')
+            if 'Vary' in change:
+                response['Vary'] = change['Vary']
+            self.application.store('key', {**environ, **change}, response)
+            self.assertIsNone(cache.get('key'))
+        response = HttpResponse('page')
+        response.page_cache = (['index'], (1,), 60)
+        self.application.store('key', environ, response)
+        self.assertEqual(cache.get('key')[4], b'page')
+
+
+class TestStaticAssets(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source, self.root = os.path.join(directory.name, 'source'), os.path.join(directory.name, 'root')
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as file:
+            file.write('body { color: black; }\n' * 100)
+        with open(os.path.join(source, 'logo.png'), 'wb') as file:
+            file.write(os.urandom(1000))
+        overridden = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=self.root,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.application = StaticFiles(lambda environ, start_response: start_response('404 Not Found', []) or [])
+
+    def request(self, path, **headers):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'wsgi.file_wrapper': lambda file, size: [file], **headers,
+        }
+        started = {}
+
+        def start_response(status, response_headers):
+            started.update(status=status, headers=dict(response_headers))
+        body = self.application(environ, start_response)
+        for file in body:
+            self.addCleanup(file.close)
+        return started['status'], started['headers'], body
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        url = staticfiles_storage.url('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        hashed = os.path.join(self.root, url[len('/static/'):])
+        for path in (hashed, hashed + '.gz', os.path.join(self.root, 'css', 'site.css.gz')):
+            self.assertTrue(os.path.exists(path), path)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'logo.png.gz')))
+        self.assertEqual(staticfiles_storage.url('missing.svg'), '/static/missing.svg')
+
+    def test_serves_precompressed_variant_through_file_wrapper(self):
+        url = staticfiles_storage.url('css/site.css')
+        status, headers, body = self.request(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertTrue(headers['Content-Type'].startswith('text/css'))
+        self.assertEqual(body[0].name, os.path.join(self.root, url[len('/static/'):]) + '.gz')
+        self.assertEqual(int(headers['Content-Length']), os.path.getsize(body[0].name))
+
+        status, plain, body = self.request(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertFalse(body[0].name.endswith('.gz'))
+        status, _, body = self.request(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', []))
+
+    def test_plain_names_and_unknown_paths(self):
+        status, headers, _ = self.request('/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.request('/static/nothing.css')[0], '404 Not Found')
+        self.assertEqual(self.request('/static/../settings.py')[0], '404 Not Found')
+        self.assertEqual(self.request('/static/css/')[0], '404 Not Found')
+
+
+class TestMediaServing(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.makedirs(os.path.join(directory.name, 'posts'))
+        self.data = bytes(range(256)) * 40
+        with open(os.path.join(directory.name, 'posts', 'photo.jpg'), 'wb') as file:
+            file.write(self.data)
+        overridden = override_settings(MEDIA_ROOT=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+
+    def get(self, path='/media/posts/photo.jpg', **headers):
+        response = self.client.get(path, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_whole_file_and_validation(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertFalse(response.has_header('Vary'))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(b''.join(response.streaming_content), self.data[100:200])
+        self.assertEqual(b''.join(self.get(HTTP_RANGE='bytes=-10').streaming_content), self.data[-10:])
+        self.assertEqual(self.get(HTTP_RANGE=f'bytes={len(self.data)}-').status_code, 416)
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"').status_code, 200)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertEqual(parse_range('bytes=-100', 10), (0, 9))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 10))
+        self.assertIsNone(parse_range('bytes=5-1', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        self.assertFalse(parse_range('bytes=10-', 10))
+        self.assertFalse(parse_range('bytes=-0', 10))
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_offload_to_front_server(self):
+        response = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/posts/photo.jpg')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_ACCEL_REDIRECT=None, MEDIA_SENDFILE=True):
+            self.assertEqual(self.get()['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, 'posts', 'photo.jpg'))
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('/media/posts/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('/media/posts/').status_code, 404)
+        self.assertEqual(self.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.post('/media/posts/photo.jpg').status_code, 405)
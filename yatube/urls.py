@@ -1,10 +1,12 @@
 from django.conf import settings
 from django.conf.urls import handler404, handler500  # noqa
-from django.conf.urls.static import static
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from . import instrumentation, media
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
@@ -15,6 +17,8 @@ urlpatterns = [
     path('about-spec/', include('django.contrib.flatpages.urls')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('perf/', instrumentation.summary_view, name='perf_summary'),
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', media.serve, name='media'),
     path('', include('posts.urls')),
 ]
 
@@ -26,5 +30,4 @@ urlpatterns += [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
+    urlpatterns += staticfiles_urlpatterns()
@@ -1,8 +1,17 @@
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 
 application = get_wsgi_application()
+
+if settings.ANONYMOUS_PAGE_CACHE:
+    from .pagecache import AnonymousPageCache
+    application = AnonymousPageCache(application)
+
+if not settings.DEBUG:
+    from .assets import StaticFiles
+    application = StaticFiles(application)